@@ -0,0 +1,216 @@
+"""
+This module contains an asyncio version of simple_comm, so one event loop can drive several robots:
+    1) AsyncRobot: non blocking script upload and telemetry stream for one robot
+    2) RobotCell: gather-style dispatch to many robots
+    3) SyncRobotCell: blocking facade running the event loop in a background thread
+
+asyncio needs CPython 3. Grasshopper components keep using the blocking simple_comm functions.
+"""
+
+import asyncio
+import struct
+import threading
+
+import simple_comm as c
+
+
+class AsyncRobot(object):
+    """
+    One robot, addressed by IP. The script connection is opened on first use and kept open.
+
+    Args:
+        robot_ip: String. IP address of the robot
+        script_port: Integer. Script port of the controller
+        rt_port: Integer. Real time port of the controller
+    """
+
+    def __init__(self, robot_ip, script_port=c.SCRIPT_PORT, rt_port=c.RT_PORT):
+        self.robot_ip = robot_ip
+        self.script_port = script_port
+        self.rt_port = rt_port
+        self._reader = None
+        self._writer = None
+        # created in the first coroutine that needs it, on Python 3.8 a lock made outside
+        # the event loop binds to the default loop instead of the one asyncio.run starts
+        self._lock = None
+
+    def _connection_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.robot_ip, self.script_port), c.CONNECT_TIMEOUT)
+
+    async def send_script(self, script_to_send):
+        """
+        Sends a script over the persistent connection, reconnecting once if it went stale
+
+        Args:
+            script_to_send: Script to send to socket
+        """
+        if len(script_to_send) > c.MAX_SCRIPT_SIZE:
+            raise Exception("Program too long")
+        data = c._to_bytes(script_to_send)
+        async with self._connection_lock():
+            try:
+                await self._connect()
+                self._writer.write(data)
+                await self._writer.drain()
+            except (OSError, asyncio.IncompleteReadError):
+                await self._close_writer()
+                await self._connect()
+                self._writer.write(data)
+                await self._writer.drain()
+
+    async def stream_telemetry(self, decode=c.decode_packet):
+        """
+        Async generator over decoded real time samples, at the full controller rate
+
+        Args:
+            decode: function turning one packet into a sample, simple_comm.decode_packet by default
+        """
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.robot_ip, self.rt_port), c.CONNECT_TIMEOUT)
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                size = struct.unpack("!i", header)[0]
+                if not c.RT_MIN_PACKET_SIZE <= size <= c.RT_MAX_PACKET_SIZE:
+                    raise ValueError("Invalid packet size %s" % size)
+                body = await reader.readexactly(size - 4)
+                yield decode(header + body)
+        finally:
+            writer.close()
+
+    async def read(self):
+        """
+        Returns:
+            one decoded real time sample
+        """
+        stream = self.stream_telemetry()
+        try:
+            return await stream.__anext__()
+        finally:
+            await stream.aclose()
+
+    async def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    async def close(self):
+        async with self._connection_lock():
+            await self._close_writer()
+
+
+class RobotCell(object):
+    """
+    A group of robots driven from one event loop
+
+    Args:
+        robot_ips: list of IP addresses
+        script_port: Integer. Script port of the controllers
+        rt_port: Integer. Real time port of the controllers
+    """
+
+    def __init__(self, robot_ips, script_port=c.SCRIPT_PORT, rt_port=c.RT_PORT):
+        self.robots = {}
+        for ip in robot_ips:
+            self.robots[ip] = AsyncRobot(ip, script_port, rt_port)
+
+    def __getitem__(self, robot_ip):
+        return self.robots[robot_ip]
+
+    async def send_scripts(self, scripts):
+        """
+        Sends one script per robot concurrently
+
+        Args:
+            scripts: dictionary of robot IP to script
+
+        Returns:
+            results: dictionary of robot IP to None, or to the exception raised for that robot
+        """
+        ips = list(scripts.keys())
+        results = await asyncio.gather(
+            *[self.robots[ip].send_script(scripts[ip]) for ip in ips], return_exceptions=True)
+        return dict(zip(ips, results))
+
+    async def broadcast(self, script_to_send):
+        """
+        Sends the same script to every robot of the cell
+        """
+        scripts = {}
+        for ip in self.robots:
+            scripts[ip] = script_to_send
+        return await self.send_scripts(scripts)
+
+    async def read(self):
+        """
+        Returns:
+            samples: dictionary of robot IP to one decoded sample, or to the exception raised
+        """
+        ips = list(self.robots.keys())
+        results = await asyncio.gather(*[self.robots[ip].read() for ip in ips], return_exceptions=True)
+        return dict(zip(ips, results))
+
+    async def close(self):
+        await asyncio.gather(*[robot.close() for robot in self.robots.values()])
+
+
+class SyncRobotCell(object):
+    """
+    Blocking facade over RobotCell for plain scripts. The event loop runs in a daemon thread
+    and every method waits for its coroutine to finish.
+    """
+
+    def __init__(self, robot_ips, script_port=c.SCRIPT_PORT, rt_port=c.RT_PORT):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self.cell = self._run(self._create_cell(robot_ips, script_port, rt_port))
+
+    async def _create_cell(self, robot_ips, script_port, rt_port):
+        # asyncio primitives bind to the loop they are created in, so build the cell inside it
+        return RobotCell(robot_ips, script_port, rt_port)
+
+    def _run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def send_script(self, script_to_send, robot_ip):
+        self._run(self.cell[robot_ip].send_script(script_to_send))
+
+    def send_scripts(self, scripts):
+        return self._run(self.cell.send_scripts(scripts))
+
+    def broadcast(self, script_to_send):
+        return self._run(self.cell.broadcast(script_to_send))
+
+    def read(self, robot_ip=None):
+        """
+        Returns:
+            one sample of robot_ip, or a dictionary of samples of all robots if no IP is given
+        """
+        if robot_ip is None:
+            return self._run(self.cell.read())
+        return self._run(self.cell[robot_ip].read())
+
+    def close(self):
+        self._run(self.cell.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(1.0)
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
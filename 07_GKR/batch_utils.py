@@ -0,0 +1,371 @@
+"""
+This module contains vectorized counterparts of the utils functions, working on NumPy arrays of many frames:
+    1) Conversion of planes to origin and rotation arrays
+    2) Rotation matrix, quaternion and axis-angle conversions
+    3) Rotation matrix and Euler angle conversions
+    4) Circle-circle intersections of many circles, with a uniform grid to find the candidate pairs
+
+It needs NumPy and does not depend on Rhino, so it runs in CPython as well.
+"""
+
+import numpy as np
+
+
+def planes_to_frames(planes):
+    """
+    Converts planes into origin and rotation arrays. Accepted inputs are
+        a list of Rhino.Geometry planes (or anything with Origin, XAxis and YAxis),
+        an (N,4,4) array of transformation matrices,
+        a tuple (origins, xaxes, yaxes) of (N,3) arrays
+
+    Args:
+        planes: planes in one of the formats above
+
+    Returns:
+        origins: (N,3) array
+        rotations: (N,3,3) array, columns are the unitized x, y and z axes of the planes
+    """
+    if isinstance(planes, tuple) and len(planes) == 3:
+        origins, xaxes, yaxes = [np.asarray(a, dtype=float).reshape(-1, 3) for a in planes]
+    elif isinstance(planes, np.ndarray):
+        matrices = planes.reshape(-1, 4, 4)
+        return matrices[:, :3, 3].astype(float), matrices[:, :3, :3].astype(float)
+    else:
+        planes = list(planes)
+        n = len(planes)
+        values = np.empty((n, 9))
+        for i, pl in enumerate(planes):
+            o, x, y = pl.Origin, pl.XAxis, pl.YAxis
+            values[i] = (o.X, o.Y, o.Z, x.X, x.Y, x.Z, y.X, y.Y, y.Z)
+        origins, xaxes, yaxes = values[:, 0:3], values[:, 3:6], values[:, 6:9]
+
+    xaxes = xaxes / np.linalg.norm(xaxes, axis=1)[:, None]
+    yaxes = yaxes / np.linalg.norm(yaxes, axis=1)[:, None]
+    zaxes = np.cross(xaxes, yaxes)
+    return origins, np.stack((xaxes, yaxes, zaxes), axis=2)
+
+
+def matrices_to_quaternions(m):
+    """
+    Converts rotation matrices to unit quaternions, choosing per matrix the best conditioned of
+    the four formulas (Shepperd's method)
+
+    Args:
+        m: (N,3,3) or (N,4,4) array of rotation or transformation matrices
+
+    Returns:
+        quaternions: (N,4) array w, x, y, z with w >= 0
+    """
+    m = np.asarray(m, dtype=float)
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+
+    # 4 w^2, 4 x^2, 4 y^2 and 4 z^2, the largest one is divided by
+    t = np.stack((1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22), axis=1)
+    largest = np.argmax(t, axis=1)
+    s = 2 * np.sqrt(np.maximum(t[np.arange(len(t)), largest], 1e-300))
+
+    q = np.empty((len(m), 4))
+    for case, (w, x, y, z) in enumerate((
+            (s / 4, (m21 - m12) / s, (m02 - m20) / s, (m10 - m01) / s),
+            ((m21 - m12) / s, s / 4, (m01 + m10) / s, (m02 + m20) / s),
+            ((m02 - m20) / s, (m01 + m10) / s, s / 4, (m12 + m21) / s),
+            ((m10 - m01) / s, (m02 + m20) / s, (m12 + m21) / s, s / 4))):
+        rows = largest == case
+        q[rows] = np.stack((w[rows], x[rows], y[rows], z[rows]), axis=1)
+
+    q /= np.linalg.norm(q, axis=1)[:, None]
+    q[q[:, 0] < 0] *= -1
+    return q
+
+
+def quaternions_to_axis_angles(q):
+    """
+    Args:
+        q: (N,4) array of unit quaternions w, x, y, z
+
+    Returns:
+        axis_angles: (N,3) array, rotation axes scaled by the rotation angle in [0, pi]
+    """
+    q = np.array(q, dtype=float)
+    q[q[:, 0] < 0] *= -1
+    v = q[:, 1:]
+    # half turns have two equal axes, take the one with a positive largest component like utils
+    half_turn = q[:, 0] < 1e-12
+    flip = half_turn & (v[np.arange(len(v)), np.argmax(np.abs(v), axis=1)] < 0)
+    v[flip] *= -1
+
+    n = np.linalg.norm(v, axis=1)
+    angle = 2 * np.arctan2(n, q[:, 0])
+    # angle / n tends to 2 / w for small rotations
+    small = n < 1e-12
+    scale = np.where(small, 2.0 / np.where(small, q[:, 0], 1.0), angle / np.where(small, 1.0, n))
+    return v * scale[:, None]
+
+
+def matrices_to_axis_angles(m):
+    """
+    Vectorized, robust version of utils.matrix_to_axis_angle. The conversion goes through
+    quaternions, so it is accurate for all angles including 0 and pi, without tolerances.
+
+    Args:
+        m: (N,3,3) or (N,4,4) array of rotation or transformation matrices
+
+    Returns:
+        axis_angles: (N,3) array, rotation axes scaled by the rotation angle in radians
+    """
+    return quaternions_to_axis_angles(matrices_to_quaternions(m))
+
+
+def axis_angles_to_matrices(axis_angles):
+    """
+    Inverse of matrices_to_axis_angles, Rodrigues' formula with series expansions for small angles
+
+    Args:
+        axis_angles: (N,3) array, rotation axes scaled by the rotation angle in radians
+
+    Returns:
+        m: (N,3,3) array of rotation matrices
+    """
+    r = np.asarray(axis_angles, dtype=float).reshape(-1, 3)
+    theta2 = (r * r).sum(axis=1)
+    theta = np.sqrt(theta2)
+    small = theta < 1e-4
+    safe = np.where(small, 1.0, theta)
+    # sin(theta) / theta and (1 - cos(theta)) / theta^2
+    a = np.where(small, 1 - theta2 / 6, np.sin(safe) / safe)
+    b = np.where(small, 0.5 - theta2 / 24, (1 - np.cos(safe)) / (safe * safe))
+
+    k = np.zeros((len(r), 3, 3))
+    k[:, 0, 1], k[:, 0, 2] = -r[:, 2], r[:, 1]
+    k[:, 1, 0], k[:, 1, 2] = r[:, 2], -r[:, 0]
+    k[:, 2, 0], k[:, 2, 1] = -r[:, 1], r[:, 0]
+    return np.eye(3) + a[:, None, None] * k + b[:, None, None] * np.matmul(k, k)
+
+
+# Below this cosine of the middle angle the first and last axes coincide (gimbal lock)
+GIMBAL_LOCK_TOLERANCE = 1e-12
+EULER_ORDERS = ("XYZ", "ZYX", "ZYZ")
+
+
+def _axis_rotations(axis, angles):
+    """
+    Returns:
+        m: (N,3,3) array of rotations by angles about the world axis "X", "Y" or "Z"
+    """
+    c, s = np.cos(angles), np.sin(angles)
+    i = "XYZ".index(axis)
+    j, k = (i + 1) % 3, (i + 2) % 3
+    m = np.zeros((len(angles), 3, 3))
+    m[:, i, i] = 1.0
+    m[:, j, j] = c
+    m[:, k, k] = c
+    m[:, k, j] = s
+    m[:, j, k] = -s
+    return m
+
+
+def euler_to_matrices(angles, order="XYZ"):
+    """
+    Rotation matrices from Euler angles. Order "XYZ" is Rx(a) * Ry(b) * Rz(c), the rotation of
+    simple_ur_script.set_tcp_by_angles, "ZYX" is Rz(a) * Ry(b) * Rx(c) (yaw, pitch, roll) and
+    "ZYZ" is Rz(a) * Ry(b) * Rz(c)
+
+    Args:
+        angles: (N,3) array of angles a, b, c in radians
+        order: String. One of EULER_ORDERS
+
+    Returns:
+        m: (N,3,3) array of rotation matrices
+    """
+    if order not in EULER_ORDERS:
+        raise ValueError("Unsupported Euler order %s" % order)
+    angles = np.asarray(angles, dtype=float).reshape(-1, 3)
+    m = np.matmul(_axis_rotations(order[0], angles[:, 0]), _axis_rotations(order[1], angles[:, 1]))
+    return np.matmul(m, _axis_rotations(order[2], angles[:, 2]))
+
+
+def matrices_to_euler(m, order="XYZ"):
+    """
+    Euler angles of rotation matrices, the inverse of euler_to_matrices. The middle angle is in
+    [-pi/2, pi/2] for "XYZ" and "ZYX" and in [0, pi] for "ZYZ", the others in [-pi, pi].
+    At gimbal lock the last angle is 0 and the first one holds the whole rotation.
+    utils.matrix_to_euler(m) equals matrices_to_euler(m, "ZYX") in reverse order.
+
+    Args:
+        m: (N,3,3) or (N,4,4) array of rotation or transformation matrices
+        order: String. One of EULER_ORDERS
+
+    Returns:
+        angles: (N,3) array of angles a, b, c in radians
+    """
+    m = np.asarray(m, dtype=float)
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+
+    if order == "XYZ":
+        cos_b = np.hypot(m00, m01)
+        b = np.arctan2(m02, cos_b)
+        a, c = np.arctan2(-m12, m22), np.arctan2(-m01, m00)
+        a_locked = np.arctan2(m21, m11)
+    elif order == "ZYX":
+        cos_b = np.hypot(m00, m10)
+        b = np.arctan2(-m20, cos_b)
+        a, c = np.arctan2(m10, m00), np.arctan2(m21, m22)
+        a_locked = np.arctan2(-m01, m11)
+    elif order == "ZYZ":
+        # sin(b) plays the part of cos(b) of the other orders
+        cos_b = np.hypot(m02, m12)
+        b = np.arctan2(cos_b, m22)
+        a, c = np.arctan2(m12, m02), np.arctan2(m21, -m20)
+        a_locked = np.arctan2(-m01, m11)
+    else:
+        raise ValueError("Unsupported Euler order %s" % order)
+
+    locked = cos_b < GIMBAL_LOCK_TOLERANCE
+    return np.stack((np.where(locked, a_locked, a), b, np.where(locked, 0.0, c)), axis=1)
+
+
+# Status of a circle pair, see circle_intersections
+NO_HIT = 0
+TANGENT = 1
+CROSSING = 2
+COINCIDENT = 3
+# Distances closer than this share of the radii count as touching
+CIRCLE_TOLERANCE = 1e-9
+# Neighbour cells visited from every cell, each pair of cells is visited once
+_HALF_NEIGHBOURHOOD = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                       if (dx, dy, dz) >= (0, 0, 0)]
+
+
+def circle_candidate_pairs(centers, radii, cell_size=None):
+    """
+    Uniform grid broad phase: finds the pairs of circles whose bounding spheres overlap.
+    Circles go into the grid cell of their center, so only neighbour cells are compared.
+
+    Args:
+        centers: (N,3) array of circle centers
+        radii: (N,) array of circle radii
+        cell_size: float. Grid cell size, at least the largest diameter, which is the default
+
+    Returns:
+        pairs: (P,2) array of circle indices i < j
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    radii = np.abs(np.asarray(radii, dtype=float)).reshape(-1)
+    n = len(centers)
+    if n < 2:
+        return np.empty((0, 2), dtype=int)
+    cell_size = max(cell_size or 0.0, 2 * radii.max(), 1e-12)
+
+    cells = np.floor((centers - centers.min(axis=0)) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    keys = np.ravel_multi_index(cells.T, dims)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    first = []
+    second = []
+    for offset in _HALF_NEIGHBOURHOOD:
+        neighbours = cells + offset
+        valid = ((neighbours >= 0) & (neighbours < dims)).all(axis=1)
+        neighbour_keys = np.ravel_multi_index(np.where(valid[:, None], neighbours, 0).T, dims)
+        start = np.searchsorted(sorted_keys, neighbour_keys, "left")
+        counts = np.where(valid, np.searchsorted(sorted_keys, neighbour_keys, "right") - start, 0)
+        total = counts.sum()
+        if not total:
+            continue
+        i = np.repeat(np.arange(n), counts)
+        run_start = np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(start, counts) + np.arange(total) - run_start]
+        if offset == (0, 0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        first.append(np.minimum(i, j))
+        second.append(np.maximum(i, j))
+
+    if not first:
+        return np.empty((0, 2), dtype=int)
+    i, j = np.concatenate(first), np.concatenate(second)
+    # narrow the cell neighbours down to overlapping bounding spheres
+    d = np.linalg.norm(centers[i] - centers[j], axis=1)
+    touching = d <= (radii[i] + radii[j]) * (1 + CIRCLE_TOLERANCE)
+    pairs = np.stack((i[touching], j[touching]), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def circle_intersections(centers1, radii1, normals1, centers2, radii2, tolerance=CIRCLE_TOLERANCE):
+    """
+    Vectorized version of utils.cir_cir_intersection for pairs of coplanar circles
+
+    Args:
+        centers1, centers2: (P,3) arrays of the centers of the first and second circles
+        radii1, radii2: (P,) arrays of the radii
+        normals1: (P,3) array of the normals of the first circles, they set the order of the points
+        tolerance: float. Share of the radii within which circles count as touching
+
+    Returns:
+        points: (P,2,3) array of intersection points, both equal for tangent circles and NaN
+            for circles that do not intersect or coincide
+        status: (P,) array of NO_HIT, TANGENT, CROSSING or COINCIDENT
+    """
+    c1 = np.asarray(centers1, dtype=float).reshape(-1, 3)
+    c2 = np.asarray(centers2, dtype=float).reshape(-1, 3)
+    r1 = np.abs(np.asarray(radii1, dtype=float)).reshape(-1)
+    r2 = np.abs(np.asarray(radii2, dtype=float)).reshape(-1)
+    normals = np.asarray(normals1, dtype=float).reshape(-1, 3)
+
+    v = c2 - c1
+    d = np.linalg.norm(v, axis=1)
+    eps = tolerance * np.maximum(r1 + r2, 1e-300)
+    coincident = (d <= eps) & (np.abs(r1 - r2) <= eps)
+    outer = np.abs(d - (r1 + r2)) <= eps
+    inner = (np.abs(d - np.abs(r1 - r2)) <= eps) & ~coincident & (d > eps)
+    crossing = (d < r1 + r2 - eps) & (d > np.abs(r1 - r2) + eps)
+
+    status = np.full(len(d), NO_HIT, dtype=np.int8)
+    status[outer | inner] = TANGENT
+    status[crossing] = CROSSING
+    status[coincident] = COINCIDENT
+
+    hit = (status == TANGENT) | (status == CROSSING)
+    safe_d = np.where(hit, d, 1.0)
+    u = v / safe_d[:, None]
+    a = (r1 * r1 - r2 * r2 + safe_d * safe_d) / (2 * safe_d)
+    h = np.sqrt(np.maximum(r1 * r1 - a * a, 0.0))
+    h[status == TANGENT] = 0.0
+    # same side as utils.cir_cir_intersection, which crosses the normal with a * u
+    across = np.cross(normals, u) * np.where(a < 0, -1.0, 1.0)[:, None]
+    across /= np.maximum(np.linalg.norm(across, axis=1), 1e-300)[:, None]
+
+    base = c1 + a[:, None] * u
+    points = np.stack((base + h[:, None] * across, base - h[:, None] * across), axis=1)
+    points[~hit] = np.nan
+    return points, status
+
+
+def intersect_circles(centers, radii, normals, cell_size=None, tolerance=CIRCLE_TOLERANCE):
+    """
+    Intersects many coplanar circles with each other, see circle_candidate_pairs and circle_intersections
+
+    Args:
+        centers: (N,3) array of circle centers
+        radii: (N,) array of circle radii
+        normals: (N,3) array of circle normals
+        cell_size: float. Grid cell size of the broad phase, the largest diameter by default
+        tolerance: float. Share of the radii within which circles count as touching
+
+    Returns:
+        pairs: (P,2) array of indices of the candidate pairs
+        points: (P,2,3) array of intersection points of each pair
+        status: (P,) array of NO_HIT, TANGENT, CROSSING or COINCIDENT
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=float).reshape(-1)
+    normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+    pairs = circle_candidate_pairs(centers, radii, cell_size)
+    i, j = pairs[:, 0], pairs[:, 1]
+    points, status = circle_intersections(centers[i], radii[i], normals[i], centers[j], radii[j], tolerance)
+    return pairs, points, status
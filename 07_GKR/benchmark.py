@@ -0,0 +1,249 @@
+"""
+Benchmarks for simple_comm against a local FakeController, no robot needed.
+
+Usage:
+    python benchmark.py [--programs N] [--connect-latency SECONDS] [--rate HZ] [--json FILE]
+
+Measures send latency, sustained script throughput, telemetry receive and decode rates,
+reconnection cost and, with NumPy, the speed and accuracy of the axis-angle conversion.
+Use --json to keep results and compare them between versions.
+"""
+
+import argparse
+import json
+import time
+
+import simple_comm as c
+from fake_controller import FakeController, make_packet
+
+
+def _program(n_moves=20):
+    cmds = ["movel(p[0.1000,0.2000,0.3000,0.0000,3.1416,0.0000], a = 0.10, v = 0.10)\n"] * n_moves
+    return c.concatenate_script(cmds)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_send(n_programs=200, connect_latency=0.0):
+    """
+    Measures programs per second sent with a fresh socket per program (send_script_once)
+    and with a pooled, persistent connection (ConnectionPool)
+
+    Returns:
+        results: dictionary of programs per second for "once" and "pooled"
+    """
+    script = _program()
+    results = {}
+    with FakeController(connect_latency=connect_latency) as fake:
+        start = time.time()
+        for _ in range(n_programs):
+            c.send_script_once(script, fake.host, fake.script_port)
+        fake.wait_for_scripts(n_programs)
+        results["once"] = n_programs / (time.time() - start)
+
+        pool = c.ConnectionPool(port=fake.script_port)
+        start = time.time()
+        for _ in range(n_programs):
+            pool.send(script, fake.host)
+        fake.wait_for_scripts(2 * n_programs)
+        results["pooled"] = n_programs / (time.time() - start)
+        pool.close()
+    return results
+
+
+def bench_latency(n_programs=200):
+    """
+    Measures the time from send_script until the controller has received the whole program
+
+    Returns:
+        results: dictionary with median and 99th percentile latency in ms
+    """
+    script = _program()
+    latencies = []
+    with FakeController() as fake:
+        pool = c.ConnectionPool(port=fake.script_port)
+        for i in range(n_programs):
+            start = time.time()
+            pool.send(script, fake.host)
+            fake.wait_for_scripts(i + 1)
+            latencies.append(time.time() - start)
+        pool.close()
+    return {"p50_ms": 1000 * _percentile(latencies, 0.5), "p99_ms": 1000 * _percentile(latencies, 0.99)}
+
+
+def bench_reconnect(n_drops=20, connect_latency=0.0):
+    """
+    Measures the cost of a send right after the controller dropped the pooled connection
+
+    Returns:
+        results: dictionary with mean send time on a warm and on a dropped connection in ms
+    """
+    script = _program()
+    warm = []
+    dropped = []
+    with FakeController(connect_latency=connect_latency) as fake:
+        pool = c.ConnectionPool(port=fake.script_port)
+        pool.send(script, fake.host)
+        received = 1
+        fake.wait_for_scripts(received)
+        for _ in range(n_drops):
+            for times in (warm, dropped):
+                if times is dropped:
+                    fake.drop_connections()
+                    time.sleep(0.05)
+                start = time.time()
+                pool.send(script, fake.host)
+                received += 1
+                fake.wait_for_scripts(received)
+                times.append(time.time() - start)
+        pool.close()
+    return {"warm_ms": 1000 * sum(warm) / len(warm), "reconnect_ms": 1000 * sum(dropped) / len(dropped)}
+
+
+def bench_telemetry(rate=500.0, duration=2.0):
+    """
+    Measures how many real time packets per second TelemetryStreamer receives and decodes
+    while the fake controller sends at the given rate
+
+    Returns:
+        results: dictionary with sent and received packets per second and the dropped fraction
+    """
+    with FakeController(rate=rate) as fake:
+        streamer = c.TelemetryStreamer(fake.host, fake.rt_port, capacity=int(rate * duration) + 1)
+        streamer.start()
+        time.sleep(duration)
+        streamer.stop()
+        sent = fake.packets_sent
+    received = streamer.packets
+    return {"sent_hz": sent / duration, "received_hz": received / duration,
+            "lost": 1.0 - float(received) / sent if sent else 0.0}
+
+
+def bench_decode(n_packets=20000):
+    """
+    Measures offline decode rates of simple_comm.decode_packet and, with NumPy, telemetry.decode_packets
+
+    Returns:
+        results: dictionary of packets per second per decoder
+    """
+    packets = [make_packet(i * 0.002, [0.001 * i] * 6) for i in range(n_packets)]
+    results = {}
+
+    start = time.time()
+    for packet in packets:
+        c.decode_packet(packet)
+    results["per_packet_hz"] = n_packets / (time.time() - start)
+
+    try:
+        import telemetry
+    except ImportError:
+        return results
+    buf = b"".join(packets)
+    start = time.time()
+    telemetry.decode_packets(buf)
+    results["vectorized_hz"] = n_packets / (time.time() - start)
+    return results
+
+
+def _rotation_error(m1, m2):
+    """
+    Angle in radians of the rotation between two (N,3,3) arrays of rotation matrices
+    """
+    import numpy as np
+    chord = np.linalg.norm(m1 - m2, axis=(1, 2)) / (2 * np.sqrt(2))
+    return 2 * np.arcsin(np.clip(chord, 0.0, 1.0))
+
+
+def bench_axis_angle(n_matrices=20000):
+    """
+    Compares utils.matrix_to_axis_angle with the vectorized batch_utils.matrices_to_axis_angles
+    on random rotations, half of them within 0.1 rad of a half turn
+
+    Returns:
+        results: dictionary of conversions per second and largest rotation error in rad for
+            "scalar" and "batch", or an empty dictionary without NumPy
+    """
+    try:
+        import numpy as np
+        import batch_utils
+        import utils
+        from geometry import rg
+    except ImportError:
+        return {}
+    rng = np.random.RandomState(0)
+    axes = rng.normal(size=(n_matrices, 3))
+    axes /= np.linalg.norm(axes, axis=1)[:, None]
+    half = n_matrices // 2
+    angles = np.concatenate((rng.uniform(0, np.pi, half), np.pi - rng.uniform(0, 0.1, n_matrices - half)))
+    matrices = batch_utils.axis_angles_to_matrices(axes * angles[:, None])
+
+    transforms = []
+    for m in matrices:
+        t = rg.Transform(1.0)
+        for i in range(3):
+            for j in range(3):
+                t[i, j] = m[i, j]
+        transforms.append(t)
+
+    results = {}
+    start = time.time()
+    scalar = np.array([tuple(utils.matrix_to_axis_angle(t)) for t in transforms])
+    results["scalar_hz"] = n_matrices / (time.time() - start)
+    start = time.time()
+    batch = batch_utils.matrices_to_axis_angles(matrices)
+    results["batch_hz"] = n_matrices / (time.time() - start)
+
+    for name, axis_angles in (("scalar", scalar), ("batch", batch)):
+        results[name + "_max_error"] = float(_rotation_error(batch_utils.axis_angles_to_matrices(axis_angles), matrices).max())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--programs", type=int, default=200)
+    parser.add_argument("--connect-latency", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=500.0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    results["send"] = bench_send(args.programs, args.connect_latency)
+    print("send_script, %d programs, connect latency %.3f s" % (args.programs, args.connect_latency))
+    print("  fresh socket per program: %10.1f programs/s" % results["send"]["once"])
+    print("  pooled connection:        %10.1f programs/s" % results["send"]["pooled"])
+
+    results["latency"] = bench_latency(args.programs)
+    print("send latency until received")
+    print("  p50: %8.3f ms   p99: %8.3f ms" % (results["latency"]["p50_ms"], results["latency"]["p99_ms"]))
+
+    results["reconnect"] = bench_reconnect(connect_latency=args.connect_latency)
+    print("reconnection cost")
+    print("  warm send: %8.3f ms   after drop: %8.3f ms" % (results["reconnect"]["warm_ms"], results["reconnect"]["reconnect_ms"]))
+
+    results["telemetry"] = bench_telemetry(args.rate)
+    print("telemetry stream at %.0f Hz" % args.rate)
+    print("  sent: %8.1f Hz   received: %8.1f Hz   lost: %5.1f %%" % (
+        results["telemetry"]["sent_hz"], results["telemetry"]["received_hz"], 100 * results["telemetry"]["lost"]))
+
+    results["decode"] = bench_decode()
+    print("telemetry decode")
+    for name in sorted(results["decode"]):
+        print("  %-16s %12.0f packets/s" % (name + ":", results["decode"][name]))
+
+    results["axis_angle"] = bench_axis_angle()
+    if results["axis_angle"]:
+        print("matrix to axis-angle")
+        for name in ("scalar", "batch"):
+            print("  %-7s %12.0f matrices/s   max error: %.2e rad" % (
+                name + ":", results["axis_angle"][name + "_hz"], results["axis_angle"][name + "_max_error"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
-import Rhino.Geometry as rg
-import rhinoscriptsyntax as rs
+from geometry import rg
 import math as m
 import simple_comm as c
 import simple_ur_script as ur
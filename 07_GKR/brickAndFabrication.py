@@ -1,8 +1,12 @@
-import Rhino.Geometry as rg
-import rhinoscriptsyntax as rs
+from geometry import rg
 import math as m
 import simple_comm as c
 import simple_ur_script as ur
+import calibration
+import compaction
+import motion_optimizer
+import motion_program as mp
+import profiling
 
 
 
@@ -146,6 +150,7 @@ class Brick(object):
 
         return (srf_0, srf_1, srf_2, srf_3, srf_4, srf_5)
 
+    @profiling.profiled("Brick.mesh")
     def mesh(self):
         """Mesh  depicting the brick:
 
@@ -164,19 +169,35 @@ class Fabrication():
     ROBOT_IP = "192.168.10.10"
 
     def __init__(self, fabricate=False, brick_planes=None, robot_ip=ROBOT_IP):
+        self.fabricate = fabricate
         self.brick_planes = brick_planes
         self.robot_ip = robot_ip
         self.accel = 0.1
         self.vel = 0.1
-        self.script = ""
+        self.program = mp.MotionProgram()
         self.way_planes = []
+        self.optimization = None
+        # robot base plane from calibration.fit_base, None for the jogged points below
+        self.base_plane = None
+
+    @property
+    def script(self):
+        """UR script of the motion program, rendered on access"""
+        return self.program.render()
 
     def tcp(self):
-        self.script += ur.set_tcp_by_angles(
-            0.0, 0.0, 74.0, m.radians(0.0), m.radians(180.0), m.radians(0))
+        ur.set_tcp_by_angles(
+            0.0, 0.0, 74.0, m.radians(0.0), m.radians(180.0), m.radians(0), program=self.program)
+
 
+    def load_calibration(self, path):
+        """Uses the robot base of a calibration saved with calibration.BaseCalibration.save"""
+        self.base_plane = calibration.load_base_plane(path)
+        return self.base_plane
 
     def set_robot_base_plane_from_pts(self):
+        if self.base_plane is not None:
+            return self.base_plane
 
         pt_0 = rg.Point3d(327, 230, 0)  # base plane origin
         # point on base plane positive x direction
@@ -214,20 +235,21 @@ class Fabrication():
         safe_plane = pick_up_plane.Clone()
         safe_plane.Translate(rg.Vector3d(0, 0, safe_distance))
 
-        self.script += ur.move_l(safe_plane, self.accel, self.vel)
+        ur.move_l(safe_plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(safe_plane)
 
-        self.script += ur.move_l(pick_up_plane, self.accel, self.vel)
+        ur.move_l(pick_up_plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(pick_up_plane)
 
-        self.script += ur.set_digital_out(4, True)
-        self.script += ur.sleep(1)
+        ur.set_digital_out(4, True, program=self.program)
+        ur.sleep(1, program=self.program)
 
-        self.script += ur.move_l(safe_plane, self.accel, self.vel)
+        ur.move_l(safe_plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(safe_plane)
 
         return None
 
+    @profiling.profiled("Fabrication.place_brick")
     def place_brick(self, plane):
         """
         this function gereates the robotic sequience for placing a brick
@@ -238,16 +260,16 @@ class Fabrication():
         safe_plane = plane.Clone()
         safe_plane.Translate(rg.Vector3d(0, 0, safe_distance))
 
-        self.script += ur.move_l(safe_plane, self.accel, self.vel)
+        ur.move_l(safe_plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(safe_plane)
 
-        self.script += ur.move_l(plane, self.accel, self.vel)
+        ur.move_l(plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(plane)
 
-        self.script += ur.set_digital_out(4, False)
-        self.script += ur.sleep(1)
+        ur.set_digital_out(4, False, program=self.program)
+        ur.sleep(1, program=self.program)
 
-        self.script += ur.move_l(safe_plane, self.accel, self.vel)
+        ur.move_l(safe_plane, self.accel, self.vel, program=self.program)
         self.way_planes.append(safe_plane)
 
         return None
@@ -284,11 +306,21 @@ class Fabrication():
         curve = rg.NurbsCurve.Create(False, 1, crv)
         return self.way_planes, curve
 
-    def send(self):
+    def send(self, compact=False, optimize=False):
         """
-        this funktion sends the script to the robot."""
-
-        self.script = c.concatenate_script(self.script)
-        #c.send_script(self.script, self.robot_ip)
-        return self.script
+        this funktion sends the script to the robot.
+        The connection to the robot is pooled, so repeated sends reuse the same socket.
+        With optimize=True redundant waypoints are dropped and the moves between bricks are blended.
+        With compact=True the repeated pick and place blocks are extracted into a loop first."""
+
+        program = self.program
+        if optimize:
+            program, self.optimization = motion_optimizer.optimize_program(program)
+        script = program.render()
+        if compact:
+            script = compaction.compact_script(script)
+        script = c.concatenate_script(script)
+        if self.fabricate:
+            c.send_script(script, self.robot_ip)
+        return script
 
@@ -0,0 +1,155 @@
+"""
+This module calibrates the robot base from touched points:
+    1) The rigid transformation from model (Rhino) to robot base coordinates is fitted to any number
+       of point pairs in the least squares sense (Kabsch, with an SVD)
+    2) The residual of every point is reported, to find badly touched points
+    3) The calibration is saved to a JSON file and loaded again, without NumPy, as base plane
+       for brickAndFabrication.Fabrication
+    4) Whole batches of planes are transformed to robot space in one call
+
+Points are in mm. At least three points that are not on one line are needed, more points average
+out the jogging error.
+"""
+
+import json
+
+from geometry import rg
+
+# NumPy is optional, it is only needed to fit and apply calibrations
+try:
+    import numpy as np
+    import batch_utils
+except ImportError:
+    np = None
+
+
+class BaseCalibration(object):
+    """
+    Rigid transformation from model to robot base coordinates
+
+    Args:
+        matrix: 4x4 nested list or array. Maps model coordinates to robot base coordinates
+        residuals: list of distances in mm between the transformed model points and the robot points
+    """
+
+    def __init__(self, matrix, residuals=None):
+        self.matrix = [[float(v) for v in row] for row in matrix]
+        self.residuals = [float(r) for r in residuals] if residuals is not None else []
+
+    def rmse(self):
+        """
+        Returns:
+            rmse: float. Root mean square of the residuals in mm
+        """
+        if not self.residuals:
+            return 0.0
+        return (sum([r * r for r in self.residuals]) / len(self.residuals)) ** 0.5
+
+    def base_plane(self):
+        """
+        Returns:
+            plane: Rhino.Geometry plane with origin t and the first two columns of R as axes, so
+                PlaneToPlane(WorldXY, plane) is the calibration, as used by
+                Fabrication.set_robot_base_plane_from_pts and rhino_to_robot_space
+        """
+        m = self.matrix
+        return rg.Plane(rg.Point3d(m[0][3], m[1][3], m[2][3]),
+                        rg.Vector3d(m[0][0], m[1][0], m[2][0]), rg.Vector3d(m[0][1], m[1][1], m[2][1]))
+
+    def transform_points(self, points):
+        """
+        Args:
+            points: (N,3) array of points in model coordinates
+
+        Returns:
+            points: (N,3) array of points in robot base coordinates
+        """
+        if np is None:
+            raise ImportError("Applying calibrations needs NumPy")
+        matrix = np.asarray(self.matrix)
+        return np.dot(np.asarray(points, dtype=float).reshape(-1, 3), matrix[:3, :3].T) + matrix[:3, 3]
+
+    def apply(self, planes):
+        """
+        Transforms many planes to robot base coordinates at once
+
+        Args:
+            planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in model coordinates)
+
+        Returns:
+            frames: (N,4,4) array of frames in robot base coordinates, accepted by the batch
+                functions of simple_ur_script
+        """
+        if np is None:
+            raise ImportError("Applying calibrations needs NumPy")
+        origins, rotations = batch_utils.planes_to_frames(planes)
+        matrix = np.asarray(self.matrix)
+        frames = np.zeros((len(origins), 4, 4))
+        frames[:, :3, :3] = np.matmul(matrix[:3, :3], rotations)
+        frames[:, :3, 3] = np.dot(origins, matrix[:3, :3].T) + matrix[:3, 3]
+        frames[:, 3, 3] = 1.0
+        return frames
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"matrix": self.matrix, "residuals": self.residuals, "rmse": self.rmse()}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["matrix"], data.get("residuals"))
+
+
+def fit_base(model_points, robot_points, weights=None):
+    """
+    Fits the rigid transformation that moves the model points onto the robot points
+
+    Args:
+        model_points: (N,3) array or list of Rhino.Geometry points, positions in the model
+        robot_points: (N,3) array or list of Rhino.Geometry points, the same positions touched with
+            the robot, in robot base coordinates
+        weights: (N,) array of point weights, None for equal weights
+
+    Returns:
+        calibration: BaseCalibration
+    """
+    if np is None:
+        raise ImportError("Fitting calibrations needs NumPy")
+    a = _points(model_points)
+    b = _points(robot_points)
+    if a.shape != b.shape:
+        raise ValueError("Got %d model points and %d robot points" % (len(a), len(b)))
+    w = np.ones(len(a)) if weights is None else np.asarray(weights, dtype=float).reshape(-1)
+    w = w / w.sum()
+
+    a_mean = np.dot(w, a)
+    b_mean = np.dot(w, b)
+    h = np.dot((a - a_mean).T * w, b - b_mean)
+    u, s, vt = np.linalg.svd(h)
+    if len(a) < 3 or s[1] <= 1e-9 * max(s[0], 1e-300):
+        raise ValueError("At least three points that are not on one line are needed")
+    # flip the weakest axis instead of returning a reflection
+    d = np.sign(np.linalg.det(np.dot(vt.T, u.T))) or 1.0
+    rotation = np.dot(vt.T * [1.0, 1.0, d], u.T)
+
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = b_mean - np.dot(rotation, a_mean)
+    residuals = np.linalg.norm(np.dot(a, rotation.T) + matrix[:3, 3] - b, axis=1)
+    return BaseCalibration(matrix.tolist(), residuals.tolist())
+
+
+def _points(points):
+    if isinstance(points, np.ndarray):
+        return points.astype(float).reshape(-1, 3)
+    return np.array([(p[0], p[1], p[2]) if isinstance(p, (tuple, list)) else (p.X, p.Y, p.Z) for p in points],
+                    dtype=float).reshape(-1, 3)
+
+
+def load_base_plane(path):
+    """
+    Returns:
+        plane: base plane of a saved calibration, see BaseCalibration.base_plane
+    """
+    return BaseCalibration.load(path).base_plane()
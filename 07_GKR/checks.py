@@ -0,0 +1,92 @@
+"""
+Correctness checks of the NumPy batch functions, no robot needed.
+
+Usage:
+    python checks.py
+
+Every check raises an AssertionError on failure, a summary line is printed for each passed check.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import batch_utils
+import brickAndFabrication as bf
+import calibration
+from geometry import rg
+
+
+def _plane_values(plane):
+    return [plane.Origin.X, plane.Origin.Y, plane.Origin.Z,
+            plane.XAxis.X, plane.XAxis.Y, plane.XAxis.Z, plane.YAxis.X, plane.YAxis.Y, plane.YAxis.Z]
+
+
+def check_calibration(n_points=8, noise=0.2, tolerance=1e-9):
+    """
+    Fits a calibration to noisy touched points and checks that Fabrication.rhino_to_robot_space
+    with the loaded calibration transforms planes like BaseCalibration.apply
+    """
+    rng = np.random.RandomState(0)
+    angle = 0.3
+    rotation = np.array([[np.cos(angle), -np.sin(angle), 0.0], [np.sin(angle), np.cos(angle), 0.0], [0.0, 0.0, 1.0]])
+    model = rng.uniform(0, 1000, (n_points, 3))
+    robot = np.dot(model, rotation.T) + (-400.0, 250.0, -390.0) + rng.normal(0, noise, (n_points, 3))
+    cal = calibration.fit_base(model, robot)
+    assert cal.rmse() < 3 * noise, cal.rmse()
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "calibration.json")
+        cal.save(path)
+        fabrication = bf.Fabrication()
+        fabrication.load_calibration(path)
+        planes = [rg.Plane(rg.Point3d(*p), rg.Vector3d(1, 0.2, 0), rg.Vector3d(-0.2, 1, 0.1)) for p in model]
+        expected = cal.apply(planes)
+        error = 0.0
+        for plane, frame in zip(planes, expected):
+            values = _plane_values(fabrication.rhino_to_robot_space(plane))
+            error = max(error, np.abs(np.array(values) - np.concatenate((frame[:3, 3], frame[:3, 0], frame[:3, 1]))).max())
+        assert error < tolerance, error
+    finally:
+        shutil.rmtree(folder)
+    print("calibration: rmse %.3f mm, rhino_to_robot_space matches apply to %.1e" % (cal.rmse(), error))
+
+
+def check_euler(n_angles=10000, tolerance=1e-12):
+    """
+    Round trips random angles and the gimbal poles through euler_to_matrices and matrices_to_euler.
+    Away from the poles the angles come back, at the poles the last angle is 0 and the matrix is
+    reproduced.
+    """
+    rng = np.random.RandomState(1)
+    # range of the middle angle of each order, its ends are the gimbal poles
+    poles = {"XYZ": (-np.pi / 2, np.pi / 2), "ZYX": (-np.pi / 2, np.pi / 2), "ZYZ": (0.0, np.pi)}
+    for order in batch_utils.EULER_ORDERS:
+        low, high = poles[order]
+        angles = rng.uniform(-np.pi, np.pi, (n_angles, 3))
+        angles[:, 1] = rng.uniform(low + 0.01, high - 0.01, n_angles)
+        result = batch_utils.matrices_to_euler(batch_utils.euler_to_matrices(angles, order), order)
+        error = np.abs(result - angles).max()
+        assert error < 1e-9, (order, error)
+
+        pole_angles = rng.uniform(-np.pi, np.pi, (2 * n_angles, 3))
+        pole_angles[:, 1] = np.repeat(poles[order], n_angles)
+        matrices = batch_utils.euler_to_matrices(pole_angles, order)
+        result = batch_utils.matrices_to_euler(matrices, order)
+        assert np.all(result[:, 2] == 0.0), order
+        assert np.abs(result[:, 1] - pole_angles[:, 1]).max() < 1e-7, order
+        pole_error = np.abs(batch_utils.euler_to_matrices(result, order) - matrices).max()
+        assert pole_error < tolerance, (order, pole_error)
+        print("euler %s: round trip error %.1e rad, at the poles %.1e" % (order, error, pole_error))
+
+
+def main():
+    check_calibration()
+    check_euler()
+
+
+if __name__ == "__main__":
+    main()
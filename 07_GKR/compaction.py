@@ -0,0 +1,139 @@
+"""
+This module compacts generated UR script:
+    1) Runs of command blocks that repeat with only their poses changing are found
+    2) Each block is hoisted into a def subroutine taking the changing poses as arguments
+    3) The poses go into pose lists and a while loop calls the subroutine once per entry
+
+Pick and place jobs, where every brick repeats the same safe-pick-gripper-safe sequence,
+shrink by 5-10x and upload faster.
+"""
+
+import re
+
+_POSE = re.compile(r"p\[[^\]]*\]")
+MIN_REPEATS = 3
+MAX_BLOCK_LENGTH = 32
+
+
+def _split_lines(list_ur_commands):
+    if isinstance(list_ur_commands, str):
+        list_ur_commands = [list_ur_commands]
+    lines = []
+    for l in "".join(list_ur_commands).split("\n"):
+        l = l.rstrip()
+        if l.strip():
+            lines.append(l)
+    return lines
+
+
+def _find_runs(keys, min_repeats, max_block_length):
+    """
+    Greedy search for runs of a block of k lines repeated at least min_repeats times
+
+    Returns:
+        runs: list of (start, k, repeats), ordered and non overlapping
+    """
+    n = len(keys)
+    # same[k][j]: number of consecutive positions from j on where line j equals line j + k
+    same = {}
+    for k in range(1, min(max_block_length, n // min_repeats) + 1):
+        run = [0] * (n + 1)
+        for j in range(n - k - 1, -1, -1):
+            if keys[j] == keys[j + k]:
+                run[j] = run[j + 1] + 1
+        same[k] = run
+
+    runs = []
+    i = 0
+    while i < n:
+        best = None
+        for k in same:
+            repeats = 1 + same[k][i] // k
+            saved = (repeats - 1) * k
+            if repeats >= min_repeats and (best is None or saved > best[0]):
+                best = (saved, k, repeats)
+        if best is None:
+            i += 1
+            continue
+        _, k, repeats = best
+        runs.append((i, k, repeats))
+        i += k * repeats
+    return runs
+
+
+def _compact_run(lines, poses, start, k, repeats, n_run):
+    """
+    Returns:
+        script: subroutine, pose lists and loop replacing one run
+    """
+    template = [_POSE.sub("%s", l.replace("%", "%%")) for l in lines[start:start + k]]
+
+    # pose slots of the block with the values they take in every repetition
+    slots = []
+    for j in range(k):
+        for s in range(len(poses[start + j])):
+            values = tuple(poses[start + r * k + j][s] for r in range(repeats))
+            slots.append((j, s, values))
+
+    params = []
+    param_of_values = {}
+    args = [[] for _ in range(k)]
+    for j, s, values in slots:
+        if len(set(values)) == 1:
+            args[j].append(values[0])
+            continue
+        name = param_of_values.get(values)
+        if name is None:
+            name = "q%d" % len(params)
+            param_of_values[values] = name
+            params.append((name, values))
+        args[j].append(name)
+
+    script = "def block_%d(%s):\n" % (n_run, ", ".join([name for name, _ in params]))
+    for j in range(k):
+        script += "\t" + template[j].strip() % tuple(args[j]) + "\n"
+    script += "end\n"
+    for name, values in params:
+        script += "poses_%d_%s = [%s]\n" % (n_run, name, ", ".join(values))
+    script += "i_%d = 0\n" % n_run
+    script += "while i_%d < %d:\n" % (n_run, repeats)
+    script += "\tblock_%d(%s)\n" % (n_run, ", ".join(["poses_%d_%s[i_%d]" % (n_run, name, n_run) for name, _ in params]))
+    script += "\ti_%d = i_%d + 1\n" % (n_run, n_run)
+    script += "end\n"
+    return script
+
+
+def compact_script(list_ur_commands, min_repeats=MIN_REPEATS, max_block_length=MAX_BLOCK_LENGTH):
+    """
+    Compacts UR script by extracting repeated blocks into a subroutine called from a loop.
+    The result is meant to be passed to simple_comm.concatenate_script like the original commands.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one script string
+        min_repeats: Integer. Minimum number of repetitions of a block to extract it
+        max_block_length: Integer. Longest block, in lines, that is searched for
+
+    Returns:
+        script: the compacted UR script, or the original lines if compaction does not make it shorter
+    """
+    lines = _split_lines(list_ur_commands)
+    poses = [_POSE.findall(l) for l in lines]
+    keys = [_POSE.sub("%s", l.strip()) for l in lines]
+    original = "".join([l + "\n" for l in lines])
+
+    runs = _find_runs(keys, min_repeats, max_block_length)
+    if not runs:
+        return original
+
+    parts = []
+    i = 0
+    for n_run, (start, k, repeats) in enumerate(runs):
+        parts.extend([l + "\n" for l in lines[i:start]])
+        parts.append(_compact_run(lines, poses, start, k, repeats, n_run))
+        i = start + k * repeats
+    parts.extend([l + "\n" for l in lines[i:]])
+    script = "".join(parts)
+
+    if len(script) >= len(original):
+        return original
+    return script
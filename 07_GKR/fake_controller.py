@@ -0,0 +1,206 @@
+"""
+This module contains a local stand-in for a UR controller:
+    1) A script port that accepts URScript programs like port 30002 and records them
+    2) A real time port that broadcasts fixed layout packets like port 30003 at a configurable rate
+
+It lets simple_comm be benchmarked and tried out on a machine without a robot.
+"""
+
+import math
+import socket
+import struct
+import threading
+import time
+
+import simple_comm as c
+
+# Packet size of the real time interface of controller software 5.x
+RT_PACKET_SIZE = 1116
+
+
+def make_packet(t, joints, packet_size=RT_PACKET_SIZE):
+    """
+    Builds one real time packet with the layout read by simple_comm.get_messages
+
+    Args:
+        t: float. Controller time in s
+        joints: list of 6 joint angles in radians, used as target and actual joints
+        packet_size: Integer. Size of the packet in bytes
+
+    Returns:
+        packet: bytes
+    """
+    packet = bytearray(packet_size)
+    struct.pack_into("!id", packet, 0, packet_size, t)
+    struct.pack_into("!6d", packet, c.RT_OFFSETS["target_joints"], *joints)
+    struct.pack_into("!6d", packet, c.RT_OFFSETS["actual_joints"], *joints)
+    struct.pack_into("!6d", packet, c.RT_OFFSETS["forces"], 0.0, 0.0, -9.81, 0.0, 0.0, 0.0)
+    struct.pack_into("!6d", packet, c.RT_OFFSETS["pose"], 0.4 + 0.1 * math.cos(t), 0.1 * math.sin(t), 0.3, 0.0, math.pi, 0.0)
+    struct.pack_into("!d", packet, c.RT_OFFSETS["time"], t)
+    return bytes(packet)
+
+
+class FakeController(object):
+    """
+    Fake UR controller listening on localhost.
+
+    Args:
+        host: String. Interface to listen on
+        script_port: Integer. Port for scripts, 0 picks a free port
+        rt_port: Integer. Port for real time packets, 0 picks a free port
+        rate: float. Real time packets per second sent to every client, 125 or 500 on real controllers
+        packet_size: Integer. Size of the real time packets
+        connect_latency: float. Seconds the controller waits before serving a new connection,
+            to emulate the handshake cost of a real controller on the cell network
+    """
+
+    def __init__(self, host="127.0.0.1", script_port=0, rt_port=0, rate=125.0, packet_size=RT_PACKET_SIZE, connect_latency=0.0):
+        self.host = host
+        self.rate = rate
+        self.packet_size = packet_size
+        self.connect_latency = connect_latency
+        self.scripts = []
+        self.connections = 0
+        self.packets_sent = 0
+        self.lock = threading.Lock()
+        self.received = threading.Condition(self.lock)
+        self.running = False
+        self._threads = []
+        self._clients = []
+
+        self._script_server = self._listen(script_port)
+        self.script_port = self._script_server.getsockname()[1]
+        self._rt_server = self._listen(rt_port)
+        self.rt_port = self._rt_server.getsockname()[1]
+
+    def _listen(self, port):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.host, port))
+        s.listen(socket.SOMAXCONN)
+        s.settimeout(0.2)
+        return s
+
+    def start(self):
+        self.running = True
+        self._spawn(self._accept_loop, self._script_server, self._serve_scripts)
+        self._spawn(self._accept_loop, self._rt_server, self._serve_rt)
+        return self
+
+    def stop(self):
+        self.running = False
+        for t in self._threads:
+            t.join(1.0)
+        self._script_server.close()
+        self._rt_server.close()
+
+    def drop_connections(self):
+        """
+        Closes every open client connection, like a controller reboot or a cable pulled in the cell
+        """
+        with self.lock:
+            clients = self._clients
+            self._clients = []
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _spawn(self, target, *args):
+        t = threading.Thread(target=target, args=args)
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def _accept_loop(self, server, handler):
+        while self.running:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            if self.connect_latency:
+                time.sleep(self.connect_latency)
+            with self.lock:
+                self.connections += 1
+                self._clients.append(conn)
+            conn.settimeout(0.2)
+            self._spawn(handler, conn)
+
+    def _serve_scripts(self, conn):
+        """
+        Splits the received stream into programs. A program ends with its first top level
+        statement that is not a definition, e.g. the "my_script()" call of concatenate_script
+        """
+        pending = b""
+        program = []
+        while self.running:
+            try:
+                data = conn.recv(65536)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            if not data:
+                break
+            pending += data
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                program.append(line)
+                stripped = line.strip()
+                if line[:1] in (b"\t", b" ") or not stripped:
+                    continue
+                if stripped.startswith(b"def ") or stripped == b"end" or stripped.startswith(b"#"):
+                    continue
+                with self.lock:
+                    self.scripts.append(b"\n".join(program) + b"\n")
+                    self.received.notify_all()
+                program = []
+        conn.close()
+
+    def _serve_rt(self, conn):
+        """
+        Sends packets on a fixed schedule, joints follow a slow sine so consecutive samples differ
+        """
+        period = 1.0 / self.rate
+        start = time.time()
+        n = 0
+        while self.running:
+            t = n * period
+            joints = [0.5 * math.sin(t + i) for i in range(6)]
+            try:
+                conn.sendall(make_packet(t, joints, self.packet_size))
+            except socket.error:
+                break
+            with self.lock:
+                self.packets_sent += 1
+            n += 1
+            delay = start + n * period - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        conn.close()
+
+    def wait_for_scripts(self, count, timeout=5.0):
+        """
+        Blocks until at least count programs were received
+
+        Returns:
+            received: Boolean. False if the timeout expired first
+        """
+        deadline = time.time() + timeout
+        with self.received:
+            while len(self.scripts) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.received.wait(remaining)
+        return True
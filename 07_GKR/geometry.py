@@ -0,0 +1,15 @@
+"""
+This module picks the geometry backend for the fabrication modules:
+    1) Rhino.Geometry when running inside Rhino / Grasshopper
+    2) np_geometry, a NumPy stand-in, everywhere else
+
+Modules import rg from here instead of importing Rhino.Geometry directly, so UR script
+generation also runs headless, e.g. on build servers or in batch jobs.
+"""
+
+try:
+    import Rhino.Geometry as rg
+    BACKEND = "rhino"
+except ImportError:
+    import np_geometry as rg
+    BACKEND = "numpy"
@@ -0,0 +1,192 @@
+"""
+This module contains optional latency instrumentation for the send/receive path:
+    1) HDR-style histograms with a bounded relative error
+    2) Named timers, recorded only while instrumentation is enabled
+    3) JSON export of all histograms
+
+When disabled, timer() returns a shared no-op context manager, so instrumented code pays
+for one function call and one attribute lookup only.
+"""
+
+import json
+import threading
+import time
+
+ENABLED = False
+# Histograms keep 2**SUB_BUCKET_BITS linear sub-buckets per power of two, about 1 % relative error
+SUB_BUCKET_BITS = 7
+
+_histograms = {}
+_lock = threading.Lock()
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class Histogram(object):
+    """
+    Log-linear histogram of integer values in microseconds, in the spirit of HdrHistogram.
+    Values below 2**(SUB_BUCKET_BITS + 1) are exact, larger values keep
+    SUB_BUCKET_BITS + 1 significant bits.
+    """
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits + 1
+        self.half = 1 << sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        return bucket * self.half + (value >> bucket)
+
+    def _value(self, index):
+        """
+        Returns:
+            the lowest value counted in the bucket at index
+        """
+        if index < 2 * self.half:
+            return index
+        bucket = index // self.half - 1
+        return (index - bucket * self.half) << bucket
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """
+        Args:
+            q: float. Percentile between 0 and 100
+
+        Returns:
+            value: lowest value of the bucket holding the percentile, 0 if empty
+        """
+        if not self.count:
+            return 0
+        target = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return self._value(index)
+        return self.max
+
+    def to_dict(self, buckets=False):
+        data = {
+            "count": self.count,
+            "min_us": self.min or 0,
+            "max_us": self.max or 0,
+            "mean_us": float(self.total) / self.count if self.count else 0.0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "p999_us": self.percentile(99.9),
+        }
+        if buckets:
+            data["buckets"] = [[self._value(i), self.counts[i]] for i in sorted(self.counts)]
+        return data
+
+
+class _Timer(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, _clock() - self.start)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def timer(name):
+    """
+    Context manager timing the enclosed block into the histogram called name
+
+    Example:
+        with instrumentation.timer("send"):
+            s.sendall(data)
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def record(name, seconds):
+    """
+    Records one duration in seconds into the histogram called name
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(seconds * 1e6)
+
+
+def histogram(name):
+    return _histograms.get(name)
+
+
+def summary(buckets=False):
+    """
+    Returns:
+        summary: dictionary of timer name to count, min, max, mean and percentiles in microseconds
+    """
+    with _lock:
+        return dict((name, h.to_dict(buckets)) for name, h in _histograms.items())
+
+
+def export_json(path=None, buckets=True):
+    """
+    Exports all histograms as JSON
+
+    Args:
+        path: String. File to write, if None the JSON string is returned
+        buckets: Boolean. Include the raw bucket counts, e.g. to merge runs later
+    """
+    text = json.dumps(summary(buckets), indent=2, sort_keys=True)
+    if path is None:
+        return text
+    with open(path, "w") as f:
+        f.write(text)
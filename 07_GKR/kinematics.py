@@ -0,0 +1,296 @@
+"""
+This module contains vectorized kinematics of the UR3, UR5 and UR10 robots:
+    1) Denavit Hartenberg matrices for many joint values at once, with the conventions of utils.dh_matrix
+    2) Forward kinematics of N joint configurations, as transformations or as UR poses
+    3) Closed form inverse kinematics returning all 8 solutions for N target planes
+    4) Selection of the solution with the least joint motion along a toolpath
+
+Lengths are in mm and angles in radians, like utils. The base frame is the robot base frame
+used by the controller and the planes describe the tool flange, unless a TCP is given.
+It needs NumPy and does not depend on Rhino, so it runs in CPython as well.
+"""
+
+import numpy as np
+
+import batch_utils
+
+# Standard DH parameters (d, theta offset, a, alpha) of each joint, from the UR documentation
+DH_PARAMETERS = {
+    "UR3": (
+        (151.9, 0.0, 0.0, np.pi / 2),
+        (0.0, 0.0, -243.65, 0.0),
+        (0.0, 0.0, -213.25, 0.0),
+        (112.35, 0.0, 0.0, np.pi / 2),
+        (85.35, 0.0, 0.0, -np.pi / 2),
+        (81.9, 0.0, 0.0, 0.0),
+    ),
+    "UR5": (
+        (89.159, 0.0, 0.0, np.pi / 2),
+        (0.0, 0.0, -425.0, 0.0),
+        (0.0, 0.0, -392.25, 0.0),
+        (109.15, 0.0, 0.0, np.pi / 2),
+        (94.65, 0.0, 0.0, -np.pi / 2),
+        (82.3, 0.0, 0.0, 0.0),
+    ),
+    "UR10": (
+        (127.3, 0.0, 0.0, np.pi / 2),
+        (0.0, 0.0, -612.0, 0.0),
+        (0.0, 0.0, -572.3, 0.0),
+        (163.941, 0.0, 0.0, np.pi / 2),
+        (115.7, 0.0, 0.0, -np.pi / 2),
+        (92.2, 0.0, 0.0, 0.0),
+    ),
+}
+
+# Joint limits of all UR joints
+JOINT_LIMIT = 2 * np.pi
+# Below this sin(theta5) the wrist is singular and theta6 is kept at the reference, it is well above
+# the rounding noise of about 1e-8 that sin(theta5) shows at an exactly singular pose
+SINGULARITY_TOLERANCE = 1e-6
+
+
+def dh_table(model):
+    """
+    Args:
+        model: String. Robot model, a key of DH_PARAMETERS, or a DH table itself
+
+    Returns:
+        table: (6,4) array of d, theta offset, a and alpha per joint
+    """
+    if isinstance(model, str):
+        model = DH_PARAMETERS[model]
+    return np.asarray(model, dtype=float)
+
+
+def dh_matrices(d, theta, a, alpha):
+    """
+    Vectorized version of utils.dh_matrix, the arguments broadcast against each other
+
+    Returns:
+        m: (...,4,4) array of Denavit Hartenberg transformation matrices
+    """
+    d, theta, a, alpha = [np.asarray(v, dtype=float) for v in (d, theta, a, alpha)]
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(alpha), np.sin(alpha)
+    m = np.zeros(np.broadcast(d, theta, a, alpha).shape + (4, 4))
+    m[..., 0, 0] = ct
+    m[..., 0, 1] = -st * ca
+    m[..., 0, 2] = st * sa
+    m[..., 0, 3] = a * ct
+    m[..., 1, 0] = st
+    m[..., 1, 1] = ct * ca
+    m[..., 1, 2] = -ct * sa
+    m[..., 1, 3] = a * st
+    m[..., 2, 1] = sa
+    m[..., 2, 2] = ca
+    m[..., 2, 3] = d
+    m[..., 3, 3] = 1.0
+    return m
+
+
+def _joint_matrix(table, joint, theta):
+    d, offset, a, alpha = table[joint]
+    return dh_matrices(d, theta + offset, a, alpha)
+
+
+def _inverse(m):
+    """
+    Inverse of rigid transformations
+    """
+    inv = np.zeros_like(m)
+    r_t = np.swapaxes(m[..., :3, :3], -1, -2)
+    inv[..., :3, :3] = r_t
+    inv[..., :3, 3] = -np.einsum("...ij,...j->...i", r_t, m[..., :3, 3])
+    inv[..., 3, 3] = 1.0
+    return inv
+
+
+def _wrap(angles):
+    return (angles + np.pi) % (2 * np.pi) - np.pi
+
+
+def plane_matrices(planes):
+    """
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays
+
+    Returns:
+        m: (N,4,4) array of transformations from the base to the planes
+    """
+    origins, rotations = batch_utils.planes_to_frames(planes)
+    m = np.zeros((len(origins), 4, 4))
+    m[:, :3, :3] = rotations
+    m[:, :3, 3] = origins
+    m[:, 3, 3] = 1.0
+    return m
+
+
+def forward_kinematics(joints, model="UR5", tcp=None):
+    """
+    Batched version of concatenating utils.dh_matrix over the joints
+
+    Args:
+        joints: (N,6) array of joint values in radians
+        model: String. Robot model, a key of DH_PARAMETERS, or a DH table
+        tcp: (4,4) array. Transformation from the flange to the tool center point, None for the flange
+
+    Returns:
+        m: (N,4,4) array of transformations from the base to the flange or the TCP
+    """
+    table = dh_table(model)
+    joints = np.asarray(joints, dtype=float).reshape(-1, 6)
+    # (N,6,4,4), one matrix per joint and configuration
+    links = dh_matrices(table[:, 0], joints + table[:, 1], table[:, 2], table[:, 3])
+    m = links[:, 0]
+    for j in range(1, 6):
+        m = np.matmul(m, links[:, j])
+    if tcp is not None:
+        m = np.matmul(m, np.asarray(tcp, dtype=float))
+    return m
+
+
+def joints_to_poses(joints, model="UR5", tcp=None):
+    """
+    Forward kinematics as UR poses, e.g. to compare recorded actual_joints with the pose telemetry
+    or with the commanded poses. Telemetry joints are in degrees, convert them with np.radians.
+
+    Args:
+        joints: (N,6) array of joint values in radians
+        model: String. Robot model, a key of DH_PARAMETERS, or a DH table
+        tcp: (4,4) array. Transformation from the flange to the tool center point, in mm, None for the flange
+
+    Returns:
+        poses: (N,6) array of x, y, z in m and the axis-angle rotation
+    """
+    m = forward_kinematics(joints, model, tcp)
+    poses = np.empty((len(m), 6))
+    poses[:, :3] = m[:, :3, 3] / 1000
+    poses[:, 3:] = batch_utils.matrices_to_axis_angles(m)
+    return poses
+
+
+def inverse_kinematics(planes, model="UR5", tcp=None, reference=None):
+    """
+    Closed form inverse kinematics for N target planes, after K. P. Hawkins, Analytic Inverse
+    Kinematics for the Universal Robots UR-5/UR-10 Arms
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+        model: String. Robot model, a key of DH_PARAMETERS, or a DH table
+        tcp: (4,4) array. Transformation from the flange to the tool center point, None for the flange
+        reference: (6,) array. Joint values used for theta6 at wrist singularities, zeros if None
+
+    Returns:
+        solutions: (N,8,6) array of joint values in ]-pi, pi], NaN for unreachable branches.
+            Branch 4 * shoulder + 2 * wrist + elbow, each of them 0 or 1
+    """
+    table = dh_table(model)
+    d4, d6 = table[3, 0], table[5, 0]
+    a2, a3 = table[1, 2], table[2, 2]
+    offsets = table[:, 1]
+
+    t06 = plane_matrices(planes)
+    if tcp is not None:
+        t06 = np.matmul(t06, _inverse(np.asarray(tcp, dtype=float)))
+    n = len(t06)
+    reference = np.zeros(6) if reference is None else np.asarray(reference, dtype=float)
+    solutions = np.full((n, 2, 2, 2, 6), np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # theta1 from the position of the wrist center, frame 5
+        p05 = t06[:, :3, 3] - d6 * t06[:, :3, 2]
+        psi = np.arctan2(p05[:, 1], p05[:, 0])
+        phi = np.arccos(d4 / np.hypot(p05[:, 0], p05[:, 1]))
+        theta1 = np.stack((psi + phi + np.pi / 2, psi - phi + np.pi / 2), axis=1)
+
+        # theta5 from the flange position seen along the rotated x axis
+        s1, c1 = np.sin(theta1), np.cos(theta1)
+        p = t06[:, :3, 3]
+        cos5 = (p[:, 0, None] * s1 - p[:, 1, None] * c1 - d4) / d6
+        acos5 = np.arccos(np.clip(cos5, -1.0, 1.0))
+        acos5[np.abs(cos5) > 1 + 1e-9] = np.nan
+        theta5 = np.stack((acos5, -acos5), axis=2)
+
+        # theta6 from the base x and y axes seen from the flange
+        r = t06[:, :3, :3]
+        s5 = np.sin(theta5)
+        y = (-r[:, 0, 1, None] * s1 + r[:, 1, 1, None] * c1)[:, :, None]
+        x = (r[:, 0, 0, None] * s1 - r[:, 1, 0, None] * c1)[:, :, None]
+        singular = np.abs(s5) < SINGULARITY_TOLERANCE
+        theta6 = np.where(singular, reference[5] + offsets[5], np.arctan2(y / s5, x / s5))
+
+        # planar 3R chain of joints 2, 3 and 4
+        theta1_b = np.broadcast_to(theta1[:, :, None], theta5.shape)
+        t01 = _joint_matrix(table, 0, theta1_b - offsets[0])
+        t45 = _joint_matrix(table, 4, theta5 - offsets[4])
+        t56 = _joint_matrix(table, 5, theta6 - offsets[5])
+        t14 = np.matmul(np.matmul(_inverse(t01), t06[:, None, None]), _inverse(np.matmul(t45, t56)))
+        # joints 2, 3 and 4 rotate about the z axis of frame 1, the chain lies in its x-y plane
+        x14, y14 = t14[..., 0, 3], t14[..., 1, 3]
+        reach2 = x14 ** 2 + y14 ** 2
+        cos3 = (reach2 - a2 ** 2 - a3 ** 2) / (2 * a2 * a3)
+        acos3 = np.arccos(np.clip(cos3, -1.0, 1.0))
+        acos3[np.abs(cos3) > 1 + 1e-9] = np.nan
+        for elbow, theta3 in enumerate((acos3, -acos3)):
+            theta2 = np.arctan2(-y14, -x14) - np.arcsin(-a3 * np.sin(theta3) / np.sqrt(reach2))
+            t12 = _joint_matrix(table, 1, theta2 - offsets[1])
+            t23 = _joint_matrix(table, 2, theta3 - offsets[2])
+            t34 = np.matmul(_inverse(np.matmul(t12, t23)), t14)
+            theta4 = np.arctan2(t34[..., 1, 0], t34[..., 0, 0])
+            q = np.stack((theta1_b, theta2, theta3, theta4, theta5, theta6), axis=-1) - offsets
+            solutions[:, :, :, elbow] = _wrap(q)
+
+    return solutions.reshape(n, 8, 6)
+
+
+def _closest(solutions, reference):
+    """
+    Shifts solutions by multiples of 2 pi to the joint values nearest to reference within the joint limits
+
+    Returns:
+        solutions: shifted solutions
+        cost: squared joint motion from reference per solution
+    """
+    shifted = reference + _wrap(solutions - reference)
+    shifted = np.where(shifted > JOINT_LIMIT, shifted - 2 * np.pi, shifted)
+    shifted = np.where(shifted < -JOINT_LIMIT, shifted + 2 * np.pi, shifted)
+    cost = ((shifted - reference) ** 2).sum(axis=-1)
+    return shifted, np.where(np.isnan(cost), np.inf, cost)
+
+
+def select_solutions(solutions, reference=None):
+    """
+    Picks for every target the solution with the least joint motion from the previous one, starting at reference
+
+    Args:
+        solutions: (N,8,6) array as returned by inverse_kinematics
+        reference: (6,) array. Joint values before the first target, zeros if None
+
+    Returns:
+        joints: (N,6) array, NaN rows for unreachable targets
+    """
+    current = np.zeros(6) if reference is None else np.asarray(reference, dtype=float)
+    joints = np.full((len(solutions), 6), np.nan)
+    for i in range(len(solutions)):
+        shifted, cost = _closest(solutions[i], current)
+        best = np.argmin(cost)
+        if np.isinf(cost[best]):
+            continue
+        current = joints[i] = shifted[best]
+    return joints
+
+
+def planes_to_joints(planes, model="UR5", tcp=None, reference=None):
+    """
+    Converts a toolpath to joint values for move_j, following the solution with the least joint motion
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+        model: String. Robot model, a key of DH_PARAMETERS, or a DH table
+        tcp: (4,4) array. Transformation from the flange to the tool center point, None for the flange
+        reference: (6,) array. Current joint values of the robot, zeros if None
+
+    Returns:
+        joints: (N,6) array, NaN rows for unreachable targets
+    """
+    return select_solutions(inverse_kinematics(planes, model, tcp, reference), reference)
@@ -0,0 +1,172 @@
+"""
+This module optimizes motion programs before they are sent:
+    1) Near duplicate and collinear waypoints of linear moves are dropped within a tolerance (Douglas-Peucker)
+    2) The remaining waypoints get the largest blend radius that is safe for their neighbour segments
+    3) The cycle time before and after is predicted with cycle_time, to report the saving
+
+Linear moves are only merged and blended between other commands, the robot still stops exactly
+at every waypoint followed by IO, sleep, popup, TCP changes or joint moves.
+"""
+
+import math
+
+import cycle_time
+import motion_program as mp
+
+# Distances in m, angles in rad
+TOLERANCE = 0.0005
+ANGLE_TOLERANCE = 0.001
+MAX_BLEND_RADIUS = 0.05
+# Share of the shorter neighbour segment used as blend radius, at most 0.5 so blends never overlap
+BLEND_FRACTION = 0.5
+
+_LINEAR = (mp.OP_MOVEL, mp.OP_MOVEL_BLEND)
+
+
+def _distance(p, q):
+    return math.sqrt((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2)
+
+
+def _distance_to_segment(p, a, b):
+    ab = (b[0] - a[0], b[1] - a[1], b[2] - a[2])
+    length2 = ab[0] * ab[0] + ab[1] * ab[1] + ab[2] * ab[2]
+    if length2 == 0:
+        return _distance(p, a)
+    t = ((p[0] - a[0]) * ab[0] + (p[1] - a[1]) * ab[1] + (p[2] - a[2]) * ab[2]) / length2
+    t = max(0.0, min(1.0, t))
+    return _distance(p, (a[0] + t * ab[0], a[1] + t * ab[1], a[2] + t * ab[2]))
+
+
+def _same_orientation(p, q, angle_tolerance):
+    return _distance(p[3:], q[3:]) < angle_tolerance
+
+
+def _same_speed(program, i, j):
+    return program.op[i] == program.op[j] and program.accel[i] == program.accel[j] and program.vel[i] == program.vel[j]
+
+
+def _runs(program):
+    """
+    Returns:
+        runs: list of (start, indices) of consecutive linear moves, start is the target the robot
+            comes from, None at the beginning and after joint moves
+    """
+    runs = []
+    run = []
+    position = start = None
+    for i in range(len(program)):
+        op = program.op[i]
+        if op in _LINEAR:
+            if not run:
+                start = position
+            run.append(i)
+            position = program.get_target(i)
+            continue
+        if run:
+            runs.append((start, run))
+            run = []
+        if op == mp.OP_MOVEJ:
+            position = None
+    if run:
+        runs.append((start, run))
+    return runs
+
+
+def _simplify(program, run, start, tolerance, angle_tolerance):
+    """
+    Simplification of one run in O(n log n) for typical paths. The run is cut into sections of the
+    same speed and orientation, their ends are kept. Inside a section Douglas-Peucker drops every
+    waypoint that lies within tolerance of the segment between the kept waypoints around it.
+
+    Returns:
+        kept: indices of the kept waypoints
+    """
+    targets = dict((i, program.get_target(i)) for i in run)
+    # chain of the start (index None) and the waypoints, with the positions that are always kept
+    chain = [(None, start)] if start is not None else []
+    fixed = [0] if start is not None else []
+    anchor = start
+    for n, i in enumerate(run):
+        chain.append((i, targets[i]))
+        if anchor is None:
+            fixed.append(len(chain) - 1)
+            anchor = targets[i]
+        elif n + 1 == len(run) or not _same_speed(program, i, run[n + 1]) or \
+                not _same_orientation(anchor, targets[run[n + 1]], angle_tolerance):
+            fixed.append(len(chain) - 1)
+            anchor = targets[i]
+
+    keep = set(fixed)
+    stack = list(zip(fixed[:-1], fixed[1:]))
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        a, b = chain[lo][1], chain[hi][1]
+        farthest, deviation = lo, -1.0
+        for k in range(lo + 1, hi):
+            d = _distance_to_segment(chain[k][1], a, b)
+            if d > deviation:
+                farthest, deviation = k, d
+        if deviation >= tolerance:
+            keep.add(farthest)
+            stack.append((lo, farthest))
+            stack.append((farthest, hi))
+    return [chain[k][0] for k in sorted(keep) if chain[k][0] is not None]
+
+
+def optimize_program(program, tolerance=TOLERANCE, angle_tolerance=ANGLE_TOLERANCE,
+                     max_blend_radius=MAX_BLEND_RADIUS, blend_fraction=BLEND_FRACTION):
+    """
+    Drops redundant waypoints and blends the remaining ones
+
+    Args:
+        program: motion_program.MotionProgram
+        tolerance: float. Largest deviation in m of the optimized path from dropped waypoints
+        angle_tolerance: float. Largest orientation difference in rad of a dropped waypoint
+        max_blend_radius: float. Largest blend radius in m
+        blend_fraction: float. Blend radius as share of the shorter neighbour segment, at most 0.5
+
+    Returns:
+        program: optimized MotionProgram
+        report: dictionary with command counts, removed and blended waypoints and the predicted
+            times in s before and after
+    """
+    blend_fraction = min(blend_fraction, 0.5)
+    keep = set(range(len(program)))
+    # target each kept waypoint is approached from
+    previous = {}
+    for start, run in _runs(program):
+        kept = _simplify(program, run, start, tolerance, angle_tolerance)
+        keep.difference_update(set(run) - set(kept))
+        for n, i in enumerate(kept):
+            previous[i] = program.get_target(kept[n - 1]) if n else start
+
+    optimized = program.select(sorted(keep))
+    indices = sorted(keep)
+    blended = 0
+    for n, i in enumerate(indices):
+        if program.op[i] not in _LINEAR or n + 1 == len(indices):
+            continue
+        j = indices[n + 1]
+        if program.op[j] not in _LINEAR or previous.get(i) is None:
+            continue
+        target = program.get_target(i)
+        radius = blend_fraction * min(_distance(previous[i], target), _distance(target, program.get_target(j)))
+        radius = min(radius, max_blend_radius)
+        if radius > optimized.blend[n]:
+            optimized.blend[n] = radius
+            blended += 1
+
+    time_before = cycle_time.estimate_time(program)
+    time_after = cycle_time.estimate_time(optimized)
+    report = {
+        "commands_before": len(program),
+        "commands_after": len(optimized),
+        "removed": len(program) - len(optimized),
+        "blended": blended,
+        "time_before": time_before,
+        "time_after": time_after,
+        "saving": 1.0 - time_after / time_before if time_before else 0.0,
+    }
+    return optimized, report
@@ -0,0 +1,438 @@
+"""
+This module contains a compact representation of motion programs:
+    1) A command table with one typed array per column: opcode, pose or joints, accel, vel, blend, IO and flags
+    2) Lazy rendering to UR script, identical to the text of the simple_ur_script functions
+    3) Saving and loading in a compact binary form
+    4) Parsing of generated UR script back into a program
+
+Programs can be inspected, optimized and re-targeted before any script is generated. It only
+needs the array module, so it runs in GhPython as well as in CPython.
+"""
+
+import numbers
+import re
+import struct
+import sys
+from array import array
+
+OP_MOVEL = 1
+OP_MOVEL_BLEND = 2
+OP_MOVEJ = 3
+OP_SET_TCP = 4
+OP_DIGITAL_OUT = 5
+OP_SLEEP = 6
+OP_POPUP = 7
+OP_SCRIPT = 8
+
+# Number of values of a pose or of a joint configuration
+TARGET_SIZE = 6
+
+# UR defaults for arguments left out of a move command
+DEFAULT_ACCEL = 1.2
+DEFAULT_VEL = 0.25
+
+# Flags of a command: its argument was given as an integer, e.g. sleep(1) or set_digital_out(4,1)
+FLAG_INTEGER = 1
+
+# Binary file: header followed by the columns as little endian arrays and the texts
+MAGIC = b"URMP"
+VERSION = 2
+_HEADER = struct.Struct("<4sHIII")
+_TEXT_SEPARATOR = u"\0"
+
+_POSE_FMT = "p[" + ("%.4f,"*6)[:-1] + "]"
+_JOINTS_FMT = "[" + ("%.2f,"*6)[:-1] + "]"
+_ZERO_TARGET = (0.0,) * TARGET_SIZE
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+LIST = r"\[\s*((?:%s\s*,\s*){5}%s)\s*\]" % (NUMBER, NUMBER)
+RE_MOVEL = re.compile(r"^movel\(\s*p%s\s*(.*)\)$" % LIST)
+RE_MOVEJ = re.compile(r"^movej\(\s*%s\s*(.*)\)$" % LIST)
+RE_KWARG = re.compile(r"(\w+)\s*=\s*(%s)" % NUMBER)
+RE_DIGITAL_OUT = re.compile(r"^set_digital_out\(\s*(\d+)\s*,\s*(True|False|true|false|1|0)\s*\)$")
+RE_SLEEP = re.compile(r"^sleep\(\s*(%s)\s*\)$" % NUMBER)
+RE_SET_TCP = re.compile(r"^set_tcp\(\s*p%s\s*\)$" % LIST)
+RE_POPUP = re.compile(r'^popup\("(.*)","(.*)"\)$')
+# Outer program def, its matching end and call are dropped when parsing
+RE_PROGRAM_DEF = re.compile(r"^def (\w+)\(\):$")
+# Statements opening a block that is closed by end
+RE_BLOCK = re.compile(r"^(def|thread|if|while|for)\b")
+
+
+def _to_bytes(a):
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes() if hasattr(a, "tobytes") else a.tostring()
+
+
+def _from_bytes(typecode, data):
+    a = array(typecode)
+    if hasattr(a, "frombytes"):
+        a.frombytes(data)
+    else:
+        a.fromstring(data)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+class MotionProgram(object):
+    """
+    Motion program stored as a command table. Command i has opcode op[i], target
+    target[6 * i:6 * i + 6] (pose in m and axis-angle rad, or joint values), accel, vel and blend
+    parameters (a linear move with a blend radius is rendered with r) and the IO columns io[i] (output id or text index) and value[i] (signal or time).
+    flags[i] holds FLAG_INTEGER for sleeps and digital outputs given an integer, so the script shows
+    sleep(1) and set_digital_out(4,1) but sleep(1.0) and set_digital_out(4,True) like simple_ur_script.
+
+    The simple_ur_script functions append to a program when it is passed as program=.
+    """
+
+    # (name, typecode) of the columns, in file order
+    COLUMNS = (("op", "B"), ("target", "d"), ("accel", "d"), ("vel", "d"), ("blend", "d"), ("io", "i"), ("value", "d"), ("flags", "B"))
+
+    def __init__(self):
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+        self.texts = []
+
+    def __len__(self):
+        return len(self.op)
+
+    def append(self, op, target=_ZERO_TARGET, accel=0.0, vel=0.0, blend=0.0, io=0, value=0.0, flags=0):
+        """
+        Appends one command
+
+        Returns:
+            index: Integer. Index of the new command
+        """
+        if len(target) != TARGET_SIZE:
+            raise ValueError("A target needs %d values, got %d" % (TARGET_SIZE, len(target)))
+        self.op.append(op)
+        self.target.extend([float(v) for v in target])
+        self.accel.append(accel)
+        self.vel.append(vel)
+        self.blend.append(blend)
+        self.io.append(io)
+        self.value.append(value)
+        self.flags.append(flags)
+        return len(self.op) - 1
+
+    def _add_text(self, text):
+        self.texts.append(text)
+        return len(self.texts) - 1
+
+    def move_l(self, pose, accel, vel):
+        return self.append(OP_MOVEL, pose, accel=accel, vel=vel)
+
+    def move_l_blend(self, pose, vel, blend_radius=0):
+        return self.append(OP_MOVEL_BLEND, pose, vel=vel, blend=blend_radius)
+
+    def move_j(self, joints, accel, vel):
+        return self.append(OP_MOVEJ, joints, accel=accel, vel=vel)
+
+    def set_tcp(self, pose):
+        return self.append(OP_SET_TCP, pose)
+
+    def set_digital_out(self, id, signal):
+        if not isinstance(signal, numbers.Integral):
+            # e.g. a variable name, kept as written
+            return self.append_script("set_digital_out(%s,%s)\n" % (id, signal))
+        integer = not isinstance(signal, bool)
+        return self.append(OP_DIGITAL_OUT, io=int(id), value=1.0 if signal else 0.0, flags=FLAG_INTEGER if integer else 0)
+
+    def sleep(self, time):
+        if not isinstance(time, numbers.Real):
+            return self.append_script("sleep(%s) \n" % (time,))
+        integer = isinstance(time, numbers.Integral)
+        return self.append(OP_SLEEP, value=time, flags=FLAG_INTEGER if integer else 0)
+
+    def popup(self, message, title):
+        index = self._add_text(message)
+        self._add_text(title)
+        return self.append(OP_POPUP, io=index)
+
+    def append_script(self, script):
+        """
+        Appends UR script that has no command of its own, it is rendered unchanged
+        """
+        return self.append(OP_SCRIPT, io=self._add_text(script))
+
+    def extend(self, other):
+        """
+        Appends all commands of another program
+        """
+        offset = len(self.texts)
+        self.texts.extend(other.texts)
+        for name, _ in self.COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+        for i in range(len(self.op) - len(other.op), len(self.op)):
+            if self.op[i] in (OP_POPUP, OP_SCRIPT):
+                self.io[i] += offset
+        return self
+
+    def get_target(self, i):
+        return tuple(self.target[TARGET_SIZE * i:TARGET_SIZE * (i + 1)])
+
+    def set_target(self, i, target):
+        self.target[TARGET_SIZE * i:TARGET_SIZE * (i + 1)] = array("d", target)
+
+    def command(self, i):
+        """
+        Returns:
+            command: tuple (op, target, accel, vel, blend, io, value, flags) of command i
+        """
+        return (self.op[i], self.get_target(i), self.accel[i], self.vel[i], self.blend[i], self.io[i], self.value[i],
+                self.flags[i])
+
+    def select(self, indices):
+        """
+        Returns:
+            program: new program with the given commands, in the given order
+        """
+        program = MotionProgram()
+        for i in indices:
+            op, target, accel, vel, blend, io, value, flags = self.command(i)
+            if op == OP_POPUP:
+                io = program._add_text(self.texts[io])
+                program._add_text(self.texts[self.io[i] + 1])
+            elif op == OP_SCRIPT:
+                io = program._add_text(self.texts[io])
+            program.append(op, target, accel, vel, blend, io, value, flags)
+        return program
+
+    def render_command(self, i):
+        """
+        Returns:
+            script: UR script of command i, as generated by the matching simple_ur_script function
+        """
+        op = self.op[i]
+        if op == OP_MOVEL and self.blend[i] > 0:
+            return "movel(%s, a = %.2f, v = %.2f, r = %.4f)\n" % (
+                _POSE_FMT % self.get_target(i), self.accel[i], self.vel[i], self.blend[i])
+        if op == OP_MOVEL:
+            return "movel(%s, a = %.2f, v = %.2f)\n" % (_POSE_FMT % self.get_target(i), self.accel[i], self.vel[i])
+        if op == OP_MOVEL_BLEND:
+            return "movel(%s, v = %.2f, r = %.4f)\n" % (_POSE_FMT % self.get_target(i), self.vel[i], self.blend[i])
+        if op == OP_MOVEJ:
+            return "movej(%s, a = %.2f, v = %.2f)\n" % (_JOINTS_FMT % self.get_target(i), self.accel[i], self.vel[i])
+        if op == OP_SET_TCP:
+            return "set_tcp(%s)\n" % (_POSE_FMT % self.get_target(i))
+        if op == OP_DIGITAL_OUT:
+            signal = self.value[i] > 0.5
+            return "set_digital_out(%s,%s)\n" % (self.io[i], int(signal) if self.flags[i] & FLAG_INTEGER else signal)
+        if op == OP_SLEEP:
+            return "sleep(%s) \n" % (int(self.value[i]) if self.flags[i] & FLAG_INTEGER else self.value[i])
+        if op == OP_POPUP:
+            return 'popup("%s","%s") \n' % (self.texts[self.io[i]], self.texts[self.io[i] + 1])
+        if op == OP_SCRIPT:
+            return self.texts[self.io[i]]
+        raise ValueError("Unknown opcode %d of command %d" % (op, i))
+
+    def lines(self):
+        """
+        Generator rendering the commands one by one
+        """
+        for i in range(len(self.op)):
+            yield self.render_command(i)
+
+    def render(self):
+        """
+        Returns:
+            script: UR script of all commands, to be passed to simple_comm.concatenate_script
+        """
+        return "".join([self.render_command(i) for i in range(len(self.op))])
+
+    def to_bytes(self):
+        texts = _TEXT_SEPARATOR.join(self.texts).encode("utf-8")
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self.op), len(self.texts), len(texts))]
+        for name, _ in self.COLUMNS:
+            parts.append(_to_bytes(getattr(self, name)))
+        parts.append(texts)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, n, n_texts, text_size = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a motion program file, or an unsupported version")
+        program = cls()
+        offset = _HEADER.size
+        for name, typecode in cls.COLUMNS:
+            size = n * array(typecode).itemsize * (TARGET_SIZE if name == "target" else 1)
+            setattr(program, name, _from_bytes(typecode, data[offset:offset + size]))
+            offset += size
+        if n_texts:
+            program.texts = data[offset:offset + text_size].decode("utf-8").split(_TEXT_SEPARATOR)
+        return program
+
+    def save(self, path):
+        """
+        Writes the program to a binary file, see load
+        """
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a program written by save
+
+        Returns:
+            program: MotionProgram
+        """
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _values(text):
+    return [float(v) for v in text.split(",")]
+
+
+def _depth_change(stripped):
+    if stripped == "end":
+        return -1
+    return 1 if RE_BLOCK.match(stripped) else 0
+
+
+def script_lines(list_ur_commands):
+    """
+    Splits UR script into lines and drops the outer program wrapper, i.e. a first line
+    def name():, its matching final end and a trailing name() call. Other lines are unchanged.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one script string
+
+    Returns:
+        lines: list of lines without line breaks
+    """
+    if isinstance(list_ur_commands, str):
+        list_ur_commands = [list_ur_commands]
+    lines = [l.rstrip("\r") for l in "\n".join(list_ur_commands).split("\n")]
+    body = [i for i, l in enumerate(lines) if l.strip()]
+    if len(body) < 2:
+        return lines
+    match = RE_PROGRAM_DEF.match(lines[body[0]].strip())
+    if not match:
+        return lines
+    last = len(body) - 1
+    call = lines[body[last]].strip() == match.group(1) + "()"
+    if call:
+        last -= 1
+    if last < 1 or lines[body[last]].strip() != "end":
+        return lines
+    # the final end has to close the def, not an inner block
+    depth = 0
+    for n in range(last + 1):
+        depth += _depth_change(lines[body[n]].strip())
+        if depth <= 0 and n < last:
+            return lines
+    return lines[body[0] + 1:body[last]] + (lines[body[-1] + 1:] if call else lines[body[last] + 1:])
+
+
+def _parse_generated_move(program, stripped):
+    """
+    Fast path for movel exactly as formatted by simple_ur_script, about three times faster than
+    the regular expressions
+
+    Returns:
+        parsed: bool. False if the statement has any other form
+    """
+    if not stripped.startswith("movel(p[") or not stripped.endswith(")"):
+        return False
+    pose, _, rest = stripped[8:-1].partition("], ")
+    values = pose.split(",")
+    args = rest.split(", ")
+    if len(values) != TARGET_SIZE or len(args) != 2:
+        return False
+    first, second = args[0].split(" = "), args[1].split(" = ")
+    if len(first) != 2 or len(second) != 2:
+        return False
+    keys = first[0] + second[0]
+    if keys != "av" and keys != "vr":
+        return False
+    try:
+        target = [float(v) for v in values]
+        x, y = float(first[1]), float(second[1])
+    except ValueError:
+        return False
+    program.op.append(OP_MOVEL if keys == "av" else OP_MOVEL_BLEND)
+    program.target.extend(target)
+    program.accel.append(x if keys == "av" else 0.0)
+    program.vel.append(y if keys == "av" else x)
+    program.blend.append(0.0 if keys == "av" else y)
+    program.io.append(0)
+    program.value.append(0.0)
+    program.flags.append(0)
+    return True
+
+
+def _parse_command(program, stripped):
+    """
+    Appends the command of one statement
+
+    Returns:
+        parsed: bool. False if the statement is no command
+    """
+    if _parse_generated_move(program, stripped):
+        return True
+    match = RE_MOVEL.match(stripped)
+    if match:
+        kwargs = dict((k, float(v)) for k, v in RE_KWARG.findall(match.group(2)))
+        if "a" in kwargs or "r" not in kwargs:
+            program.append(OP_MOVEL, _values(match.group(1)), kwargs.get("a", DEFAULT_ACCEL),
+                           kwargs.get("v", DEFAULT_VEL), kwargs.get("r", 0.0))
+        else:
+            program.move_l_blend(_values(match.group(1)), kwargs.get("v", DEFAULT_VEL), kwargs["r"])
+        return True
+    match = RE_MOVEJ.match(stripped)
+    if match:
+        kwargs = dict((k, float(v)) for k, v in RE_KWARG.findall(match.group(2)))
+        program.move_j(_values(match.group(1)), kwargs.get("a", DEFAULT_ACCEL), kwargs.get("v", DEFAULT_VEL))
+        return True
+    match = RE_SET_TCP.match(stripped)
+    if match:
+        program.set_tcp(_values(match.group(1)))
+        return True
+    match = RE_DIGITAL_OUT.match(stripped)
+    if match:
+        signal = match.group(2)
+        program.set_digital_out(int(match.group(1)), int(signal) if signal in ("0", "1") else signal in ("True", "true"))
+        return True
+    match = RE_SLEEP.match(stripped)
+    if match:
+        time = match.group(1)
+        program.sleep(int(time) if time.lstrip("+-").isdigit() else float(time))
+        return True
+    match = RE_POPUP.match(stripped)
+    if match:
+        program.popup(match.group(1), match.group(2))
+        return True
+    return False
+
+
+def parse_script(list_ur_commands, program=None):
+    """
+    Converts UR script, as generated by simple_ur_script, into a motion program. The outer program
+    wrapper is dropped, see script_lines. Statements without a command of their own and everything
+    inside blocks like def, if and while are kept verbatim as script.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one script string
+        program: MotionProgram to append to, a new one if None
+
+    Returns:
+        program: MotionProgram
+    """
+    if program is None:
+        program = MotionProgram()
+    depth = 0
+    for line in script_lines(list_ur_commands):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if depth == 0 and _parse_command(program, stripped):
+            continue
+        depth = max(0, depth + _depth_change(stripped))
+        program.append_script(line + "\n")
+    return program
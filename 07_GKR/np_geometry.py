@@ -0,0 +1,350 @@
+"""
+This module is a lightweight NumPy stand-in for the parts of Rhino.Geometry used by utils,
+simple_ur_script, brick and brickAndFabrication:
+    1) Point3d and Vector3d
+    2) Plane, including WorldXY, Clone, Transform and Translate
+    3) Transform, including PlaneToPlane, Rotation, Translation and the M00..M33 entries
+
+Names and behaviour follow RhinoCommon, so the modules can use it as rg when Rhino is not
+available, see geometry.py. Display geometry (meshes, surfaces, curves) is not provided.
+"""
+
+import math
+
+import numpy as np
+
+
+class _Coordinates(object):
+    """
+    Common base of Point3d and Vector3d
+    """
+
+    __slots__ = ("X", "Y", "Z")
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.X = float(x)
+        self.Y = float(y)
+        self.Z = float(z)
+
+    def __getitem__(self, i):
+        return (self.X, self.Y, self.Z)[i]
+
+    def __iter__(self):
+        return iter((self.X, self.Y, self.Z))
+
+    def __len__(self):
+        return 3
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.X == other.X and self.Y == other.Y and self.Z == other.Z
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.X, self.Y, self.Z))
+
+    def __repr__(self):
+        return "%s,%s,%s" % (self.X, self.Y, self.Z)
+
+    def _array(self):
+        return np.array((self.X, self.Y, self.Z))
+
+    def Clone(self):
+        return type(self)(self.X, self.Y, self.Z)
+
+    def DistanceTo(self, other):
+        return math.sqrt((self.X - other.X) ** 2 + (self.Y - other.Y) ** 2 + (self.Z - other.Z) ** 2)
+
+
+class Point3d(_Coordinates):
+    __slots__ = ()
+
+    def __add__(self, other):
+        return Point3d(self.X + other.X, self.Y + other.Y, self.Z + other.Z)
+
+    def __sub__(self, other):
+        if isinstance(other, Point3d):
+            return Vector3d(self.X - other.X, self.Y - other.Y, self.Z - other.Z)
+        return Point3d(self.X - other.X, self.Y - other.Y, self.Z - other.Z)
+
+    def __mul__(self, k):
+        return Point3d(self.X * k, self.Y * k, self.Z * k)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, k):
+        return Point3d(self.X / k, self.Y / k, self.Z / k)
+
+    __div__ = __truediv__
+
+    def Transform(self, xform):
+        m = xform.m
+        w = m[3, 0] * self.X + m[3, 1] * self.Y + m[3, 2] * self.Z + m[3, 3]
+        p = m[:3, :3].dot(self._array()) + m[:3, 3]
+        self.X, self.Y, self.Z = (p / w).tolist()
+
+
+class Vector3d(_Coordinates):
+    __slots__ = ()
+
+    def __add__(self, other):
+        if isinstance(other, Point3d):
+            return Point3d(self.X + other.X, self.Y + other.Y, self.Z + other.Z)
+        return Vector3d(self.X + other.X, self.Y + other.Y, self.Z + other.Z)
+
+    def __sub__(self, other):
+        return Vector3d(self.X - other.X, self.Y - other.Y, self.Z - other.Z)
+
+    def __neg__(self):
+        return Vector3d(-self.X, -self.Y, -self.Z)
+
+    def __mul__(self, other):
+        # like RhinoCommon, vector * vector is the dot product
+        if isinstance(other, _Coordinates):
+            return self.X * other.X + self.Y * other.Y + self.Z * other.Z
+        return Vector3d(self.X * other, self.Y * other, self.Z * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, k):
+        return Vector3d(self.X / k, self.Y / k, self.Z / k)
+
+    __div__ = __truediv__
+
+    @property
+    def Length(self):
+        return math.sqrt(self.X * self.X + self.Y * self.Y + self.Z * self.Z)
+
+    def Unitize(self):
+        length = self.Length
+        if length == 0:
+            return False
+        self.X /= length
+        self.Y /= length
+        self.Z /= length
+        return True
+
+    def Reverse(self):
+        self.X, self.Y, self.Z = -self.X, -self.Y, -self.Z
+        return True
+
+    def Transform(self, xform):
+        self.X, self.Y, self.Z = xform.m[:3, :3].dot(self._array()).tolist()
+
+    @staticmethod
+    def Multiply(v1, v2):
+        if isinstance(v2, _Coordinates):
+            return v1 * v2
+        return Vector3d(v1.X * v2, v1.Y * v2, v1.Z * v2)
+
+    @staticmethod
+    def CrossProduct(a, b):
+        return Vector3d(a.Y * b.Z - a.Z * b.Y, a.Z * b.X - a.X * b.Z, a.X * b.Y - a.Y * b.X)
+
+
+class _Constant(object):
+    """
+    Class attribute returning a new object on every access, like the static properties of RhinoCommon
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __get__(self, obj, cls):
+        return self.factory()
+
+
+Vector3d.XAxis = _Constant(lambda: Vector3d(1, 0, 0))
+Vector3d.YAxis = _Constant(lambda: Vector3d(0, 1, 0))
+Vector3d.ZAxis = _Constant(lambda: Vector3d(0, 0, 1))
+Vector3d.Zero = _Constant(lambda: Vector3d(0, 0, 0))
+Point3d.Origin = _Constant(lambda: Point3d(0, 0, 0))
+
+
+class Plane(object):
+    """
+    Plane(origin, xDirection, yDirection). The axes are unitized and the y axis is made
+    perpendicular to the x axis, as in RhinoCommon.
+    """
+
+    def __init__(self, origin, x_direction=None, y_direction=None):
+        if isinstance(origin, Plane):
+            origin, x_direction, y_direction = origin.Origin, origin.XAxis, origin.YAxis
+        x = np.array(tuple(x_direction), dtype=float)
+        y = np.array(tuple(y_direction), dtype=float)
+        x /= np.linalg.norm(x)
+        y -= x * x.dot(y)
+        y /= np.linalg.norm(y)
+        self._set(np.array(tuple(origin), dtype=float), x, y)
+
+    def _set(self, o, x, y):
+        self.Origin = Point3d(*o.tolist())
+        self.XAxis = Vector3d(*x.tolist())
+        self.YAxis = Vector3d(*y.tolist())
+        self.ZAxis = Vector3d(*np.cross(x, y).tolist())
+
+    @property
+    def OriginX(self):
+        return self.Origin.X
+
+    @property
+    def OriginY(self):
+        return self.Origin.Y
+
+    @property
+    def OriginZ(self):
+        return self.Origin.Z
+
+    @property
+    def Normal(self):
+        return self.ZAxis.Clone()
+
+    def __eq__(self, other):
+        return isinstance(other, Plane) and self.Origin == other.Origin and \
+            self.XAxis == other.XAxis and self.YAxis == other.YAxis and self.ZAxis == other.ZAxis
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.Origin, self.XAxis, self.YAxis))
+
+    def __repr__(self):
+        return "Origin=%r XAxis=%r, YAxis=%r, ZAxis=%r" % (self.Origin, self.XAxis, self.YAxis, self.ZAxis)
+
+    def Clone(self):
+        return Plane(self)
+
+    def Transform(self, xform):
+        o = self.Origin.Clone()
+        o.Transform(xform)
+        x = self.XAxis.Clone()
+        x.Transform(xform)
+        y = self.YAxis.Clone()
+        y.Transform(xform)
+        self.__init__(o, x, y)
+        return True
+
+    def Translate(self, delta):
+        self.Origin = self.Origin + delta
+        return True
+
+    def PointAt(self, u, v, w=0.0):
+        return self.Origin + self.XAxis * u + self.YAxis * v + self.ZAxis * w
+
+
+Plane.WorldXY = _Constant(lambda: Plane(Point3d(0, 0, 0), Vector3d(1, 0, 0), Vector3d(0, 1, 0)))
+Plane.WorldYZ = _Constant(lambda: Plane(Point3d(0, 0, 0), Vector3d(0, 1, 0), Vector3d(0, 0, 1)))
+Plane.WorldZX = _Constant(lambda: Plane(Point3d(0, 0, 0), Vector3d(0, 0, 1), Vector3d(1, 0, 0)))
+
+
+def _frame(plane):
+    """
+    4x4 matrix mapping world XY onto the plane
+    """
+    f = np.eye(4)
+    f[:3, 0] = tuple(plane.XAxis)
+    f[:3, 1] = tuple(plane.YAxis)
+    f[:3, 2] = tuple(plane.ZAxis)
+    f[:3, 3] = tuple(plane.Origin)
+    return f
+
+
+class Transform(object):
+    """
+    4x4 transformation matrix. Transform() is the zero matrix and Transform(d) a diagonal
+    matrix, as in RhinoCommon. Entries are available as M00..M33 and as xform[i, j].
+    """
+
+    def __init__(self, diagonal=None):
+        if isinstance(diagonal, Transform):
+            self.m = diagonal.m.copy()
+        elif diagonal is None:
+            self.m = np.zeros((4, 4))
+        else:
+            self.m = np.eye(4) * float(diagonal)
+
+    @classmethod
+    def _from_array(cls, m):
+        xform = cls()
+        xform.m = np.array(m, dtype=float)
+        return xform
+
+    @staticmethod
+    def PlaneToPlane(plane0, plane1):
+        return Transform._from_array(_frame(plane1).dot(np.linalg.inv(_frame(plane0))))
+
+    @staticmethod
+    def Rotation(angle, rotation_axis, rotation_center=None):
+        axis = np.array(tuple(rotation_axis), dtype=float)
+        axis /= np.linalg.norm(axis)
+        k = np.array(((0, -axis[2], axis[1]), (axis[2], 0, -axis[0]), (-axis[1], axis[0], 0)))
+        m = np.eye(4)
+        m[:3, :3] = np.eye(3) + math.sin(angle) * k + (1 - math.cos(angle)) * k.dot(k)
+        if rotation_center is not None:
+            c = np.array(tuple(rotation_center), dtype=float)
+            m[:3, 3] = c - m[:3, :3].dot(c)
+        return Transform._from_array(m)
+
+    @staticmethod
+    def Translation(motion):
+        m = np.eye(4)
+        m[:3, 3] = tuple(motion)
+        return Transform._from_array(m)
+
+    @staticmethod
+    def Scale(anchor, factor):
+        m = np.eye(4)
+        m[:3, :3] *= factor
+        m[:3, 3] = np.array(tuple(anchor)) * (1 - factor)
+        return Transform._from_array(m)
+
+    def __getitem__(self, index):
+        return float(self.m[index])
+
+    def __setitem__(self, index, value):
+        self.m[index] = value
+
+    def __mul__(self, other):
+        if isinstance(other, Transform):
+            return Transform._from_array(self.m.dot(other.m))
+        if isinstance(other, _Coordinates):
+            result = other.Clone()
+            result.Transform(self)
+            return result
+        return NotImplemented
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and (self.m == other.m).all()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Transform(%s)" % self.m.tolist()
+
+    def Clone(self):
+        return Transform(self)
+
+    def TryGetInverse(self):
+        try:
+            return True, Transform._from_array(np.linalg.inv(self.m))
+        except np.linalg.LinAlgError:
+            return False, Transform()
+
+    def ToFloatArray(self, rowDominant=True):
+        return (self.m if rowDominant else self.m.T).ravel().tolist()
+
+
+Transform.Identity = _Constant(lambda: Transform(1.0))
+Transform.ZeroTransformation = _Constant(lambda: Transform())
+
+
+def _entry(i, j):
+    return property(lambda self: float(self.m[i, j]), lambda self, value: self.m.__setitem__((i, j), value))
+
+
+for _i in range(4):
+    for _j in range(4):
+        setattr(Transform, "M%d%d" % (_i, _j), _entry(_i, _j))
@@ -0,0 +1,147 @@
+"""
+This module analyses polylines such as drawing and print paths in one NumPy pass:
+    1) Signed angles between many vector pairs, the vectorized version of utils.signed_angle
+    2) Turning angle, curvature and cumulative turning at every vertex of a polyline
+    3) Blend radii and velocities for the vertices, used by simple_ur_script.move_l_path
+
+Points are in mm like the planes, blend radii are returned in m and velocities in m/s like in
+the UR script functions. It needs NumPy and is meant for CPython.
+"""
+
+import numpy as np
+
+# Paths lie in the XY plane unless a normal is given
+NORMAL = (0.0, 0.0, 1.0)
+# Share of the shorter neighbour segment used as blend radius, at most 0.5 so blends never overlap
+BLEND_FRACTION = 0.5
+# Vertices turning less than this angle in rad are passed without slowing down
+ANGLE_TOLERANCE = 0.001
+
+
+def signed_angles(v1, v2, normals=NORMAL):
+    """
+    Gets the angles between many vector pairs -pi < theta < pi, see utils.signed_angle
+
+    Args:
+        v1: (N,3) array of first vectors
+        v2: (N,3) array of second vectors
+        normals: (N,3) or (3,) array of normals that determine what is positive/negative
+
+    Returns:
+        theta: (N,) array of signed angles between -pi and pi
+    """
+    v1 = np.asarray(v1, dtype=float).reshape(-1, 3)
+    v2 = np.asarray(v2, dtype=float).reshape(-1, 3)
+    n = np.cross(v1, v2)
+    # atan2 does not need unitized vectors
+    theta = np.arctan2(np.linalg.norm(n, axis=1), (v1 * v2).sum(axis=1))
+    negative = (n * np.asarray(normals, dtype=float)).sum(axis=-1) < 0
+    return np.where(negative, -theta, theta)
+
+
+def analyze_path(points, normal=NORMAL, closed=False):
+    """
+    Measures the turning of a polyline at its vertices
+
+    Args:
+        points: (N,3) array of vertices in mm
+        normal: (3,) or (N,3) array, normal of the path that determines left and right turns
+        closed: bool. True if the last vertex connects back to the first one
+
+    Returns:
+        result: dictionary with
+            lengths: (N-1,) array of segment lengths in mm, (N,) for closed paths
+            distance: (N,) array of the path length in mm up to each vertex
+            turning: (N,) array of signed turning angles in rad, 0 at the ends of open paths
+            curvature: (N,) array of discrete curvature in 1/mm, the turning angle divided by
+                the mean length of the neighbour segments
+            cumulative_turning: (N,) array of the sum of absolute turning angles up to each vertex
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    n = len(points)
+    segments = np.diff(np.vstack((points, points[:1])) if closed else points, axis=0)
+    lengths = np.linalg.norm(segments, axis=1)
+
+    turning = np.zeros(n)
+    curvature = np.zeros(n)
+    if len(segments) > 1:
+        # segment coming in and going out of each vertex
+        incoming = np.roll(segments, 1, axis=0) if closed else segments[:-1]
+        outgoing = segments if closed else segments[1:]
+        incoming_length = np.roll(lengths, 1) if closed else lengths[:-1]
+        outgoing_length = lengths if closed else lengths[1:]
+        inner = slice(None) if closed else slice(1, -1)
+        normal = np.asarray(normal, dtype=float)
+        if normal.ndim == 2:
+            normal = normal[inner]
+        turning[inner] = signed_angles(incoming, outgoing, normal)
+        # vertices of zero length segments have no direction change
+        degenerate = (incoming_length == 0) | (outgoing_length == 0)
+        turning[inner] = np.where(degenerate, 0.0, turning[inner])
+        mean_length = (incoming_length + outgoing_length) / 2
+        curvature[inner] = np.where(degenerate, 0.0, turning[inner] / np.where(degenerate, 1.0, mean_length))
+
+    distance = np.zeros(n)
+    distance[1:] = np.cumsum(lengths[:n - 1])
+    return {
+        "lengths": lengths,
+        "distance": distance,
+        "turning": turning,
+        "curvature": curvature,
+        "cumulative_turning": np.cumsum(np.abs(turning)),
+    }
+
+
+def blend_radii(points, max_blend_radius, blend_fraction=BLEND_FRACTION):
+    """
+    Blend radius for every vertex of an open polyline, the largest that stays within its neighbour
+    segments. Only the ends get no blend, so the robot does not stop at straight vertices.
+
+    Args:
+        points: (N,3) array of vertices in mm
+        max_blend_radius: float. Largest blend radius in m
+        blend_fraction: float. Blend radius as share of the shorter neighbour segment, at most 0.5
+
+    Returns:
+        radii: (N,) array of blend radii in m
+    """
+    analysis = analyze_path(points)
+    lengths = analysis["lengths"]
+    radii = np.zeros(len(analysis["turning"]))
+    if len(lengths) > 1:
+        shorter = np.minimum(lengths[:-1], lengths[1:]) / 1000
+        radii[1:-1] = np.minimum(min(blend_fraction, 0.5) * shorter, max_blend_radius)
+    return radii
+
+
+def velocities(points, vel, accel, min_vel=0.0, blend_radius=None, angle_tolerance=ANGLE_TOLERANCE):
+    """
+    Velocity for every vertex of an open polyline, limited so the centripetal acceleration
+    v^2 / r through the blend at the vertex stays below accel.
+
+    Args:
+        points: (N,3) array of vertices in mm
+        vel: float. Tool speed in m/s on straight segments
+        accel: float. Largest centripetal acceleration in m/s^2
+        min_vel: float. Lowest returned speed in m/s
+        blend_radius: (N,) array of blend radii in m, see blend_radii. Without blends the
+            curvature of the polyline is used
+        angle_tolerance: float. Vertices turning less than this in rad are passed at full speed
+
+    Returns:
+        vel: (N,) array of tool speeds in m/s
+    """
+    analysis = analyze_path(points)
+    if blend_radius is None:
+        # curvature in 1/m
+        curvature = np.abs(analysis["curvature"]) * 1000
+    else:
+        # a blend of radius r at a vertex turning by theta is an arc of radius r / tan(theta / 2)
+        half = np.abs(analysis["turning"]) / 2
+        radius = np.asarray(blend_radius, dtype=float)
+        curvature = np.where(radius > 0, np.tan(half) / np.where(radius > 0, radius, 1.0), np.inf)
+    # nearly straight vertices and the ends do not slow the tool down
+    curvature[np.abs(analysis["turning"]) < angle_tolerance] = 0.0
+    with np.errstate(divide="ignore"):
+        limit = np.sqrt(abs(accel) / curvature)
+    return np.clip(limit, min_vel, abs(vel))
@@ -0,0 +1,185 @@
+"""
+This module contains an opt-in profiling registry for hot geometry and script functions:
+    1) The profiled decorator tags functions, it returns them unchanged unless the GKR_PROFILE
+       environment variable is set when the module is imported, so production runs pay nothing
+    2) Tagged functions collect call counts, cumulative and self time and, on CPython with
+       tracemalloc, the net allocated memory
+    3) A report sorted by self or cumulative time and collapsed stacks for flamegraph.pl or
+       speedscope are dumped after a Grasshopper solve or a batch run
+
+Set GKR_PROFILE=1 before starting Rhino or Python, GKR_PROFILE_MEMORY=1 to trace allocations and
+GKR_PROFILE_OUTPUT to a file name to write the report when the interpreter exits.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PROFILE = os.environ.get("GKR_PROFILE", "") not in ("", "0")
+ENABLED = PROFILE
+
+# name -> [calls, cumulative s, self s, allocated bytes]
+_stats = {}
+# collapsed stack "outer;inner" -> self s
+_stacks = {}
+_lock = threading.Lock()
+_local = threading.local()
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def _memory():
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+
+def enable(memory=False):
+    """
+    Starts recording in functions that were tagged while GKR_PROFILE was set
+
+    Args:
+        memory: Boolean. Also trace allocations, needs tracemalloc (CPython 3)
+    """
+    global ENABLED
+    ENABLED = True
+    if memory and tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _stacks.clear()
+
+
+def profiled(name=None):
+    """
+    Decorator tagging a function for profiling, with or without a name
+
+    Example:
+        @profiling.profiled("Brick.mesh")
+        def mesh(self):
+            ...
+
+    Args:
+        name: String. Name in the report, module and function name by default
+    """
+    if callable(name):
+        return profiled()(name)
+
+    def decorator(function):
+        if not PROFILE:
+            return function
+        label = name or "%s.%s" % (function.__module__, getattr(function, "__qualname__", function.__name__))
+
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            # name and time spent in profiled callees
+            frame = [label, 0.0]
+            stack.append(frame)
+            memory = _memory()
+            start = _clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = _clock() - start
+                allocated = _memory() - memory
+                path = ";".join([f[0] for f in stack])
+                stack.pop()
+                recursive = any(f[0] == label for f in stack)
+                if stack:
+                    stack[-1][1] += elapsed
+                self_time = elapsed - frame[1]
+                with _lock:
+                    stats = _stats.get(label)
+                    if stats is None:
+                        stats = _stats[label] = [0, 0.0, 0.0, 0]
+                    stats[0] += 1
+                    if not recursive:
+                        # recursive calls are already inside the time of the outer call
+                        stats[1] += elapsed
+                        stats[3] += allocated
+                    stats[2] += self_time
+                    _stacks[path] = _stacks.get(path, 0.0) + self_time
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    Returns:
+        stats: dictionary of function name to calls, cumulative and self time in s and the net
+            allocated bytes, 0 without tracemalloc
+    """
+    with _lock:
+        return dict((name, {"calls": s[0], "cumulative": s[1], "self": s[2], "allocated": s[3]})
+                    for name, s in _stats.items())
+
+
+def report(sort="self", limit=None):
+    """
+    Args:
+        sort: String. Column to sort by, "self", "cumulative", "calls" or "allocated"
+        limit: Integer. Number of rows, None for all
+
+    Returns:
+        report: text table, one function per row
+    """
+    rows = sorted(stats().items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+    lines = ["%-40s %10s %12s %12s %12s %12s" % ("function", "calls", "cumulative ms", "self ms", "per call us", "alloc KiB")]
+    for name, s in rows:
+        lines.append("%-40s %10d %12.3f %12.3f %12.3f %12.1f" % (
+            name, s["calls"], s["cumulative"] * 1e3, s["self"] * 1e3,
+            s["cumulative"] * 1e6 / s["calls"] if s["calls"] else 0.0, s["allocated"] / 1024.0))
+    return "\n".join(lines)
+
+
+def collapsed_stacks():
+    """
+    Returns:
+        text: one "outer;inner self_time_us" line per call stack, the input of flamegraph.pl
+    """
+    with _lock:
+        return "\n".join("%s %d" % (path, int(round(t * 1e6))) for path, t in sorted(_stacks.items()))
+
+
+def dump(path=None, format="report"):
+    """
+    Writes the report or the collapsed stacks
+
+    Args:
+        path: String. File to write, if None the text is returned
+        format: String. "report" or "collapsed"
+    """
+    text = collapsed_stacks() if format == "collapsed" else report()
+    if path is None:
+        return text
+    with open(path, "w") as f:
+        f.write(text + "\n")
+
+
+if PROFILE:
+    if os.environ.get("GKR_PROFILE_MEMORY", "") not in ("", "0"):
+        enable(memory=True)
+    _output = os.environ.get("GKR_PROFILE_OUTPUT")
+    if _output:
+        atexit.register(dump, _output, "collapsed" if _output.endswith((".folded", ".collapsed")) else "report")
@@ -0,0 +1,221 @@
+"""
+This module contains a precomputed reachability map of the robot workspace:
+    1) Positions on a voxel grid in the robot base frame are tested with inverse kinematics for
+       a set of tool directions spread over the sphere
+    2) The result is one bit per voxel and direction, saved to a disk cache keyed by robot model,
+       TCP and sampling
+    3) Whole lists of planes are checked with constant time lookups, before any script is generated
+
+Rotations about the tool z axis are free thanks to the last joint, so only the tool direction is
+sampled, which is exact for TCPs on the flange axis. The map is an approximation: positions are
+tested at the voxel centres and tool directions are snapped to the nearest of the n_directions
+sampled ones (at most 64). Poses close to the boundary of the reachable positions or directions can
+be reported wrongly, in a test with random forward kinematics poses of a UR5 at the default
+sampling about 10 % of reachable poses were reported unreachable. Treat False as "probably
+unreachable" and use kinematics.inverse_kinematics for an exact answer.
+It needs NumPy and is meant for CPython.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+import batch_utils
+import kinematics
+
+RESOLUTION = 50.0
+DIRECTIONS = 64
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ur_reachability")
+# Changes of the sampling invalidate cached maps
+VERSION = 1
+# Number of position and direction samples solved at once
+CHUNK_SIZE = 100000
+
+
+def sphere_directions(n):
+    """
+    Returns:
+        directions: (n,3) array of unit vectors spread evenly over the sphere (Fibonacci lattice)
+    """
+    i = np.arange(n) + 0.5
+    z = 1 - 2 * i / n
+    r = np.sqrt(1 - z * z)
+    phi = np.pi * (3 - np.sqrt(5)) * i
+    return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=1)
+
+
+def _rotations(directions):
+    """
+    Returns:
+        rotations: (n,3,3) array of frames with the z axis along the directions
+    """
+    helper = np.where(np.abs(directions[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    x = np.cross(helper, directions)
+    x /= np.linalg.norm(x, axis=1)[:, None]
+    y = np.cross(directions, x)
+    return np.stack((x, y, directions), axis=2)
+
+
+def _reach(table, tcp):
+    """
+    Upper bound of the distance of the TCP from the shoulder
+    """
+    reach = np.abs(table[:, 2]).sum() + np.abs(table[1:, 0]).sum()
+    if tcp is not None:
+        reach += np.linalg.norm(np.asarray(tcp, dtype=float)[:3, 3])
+    return reach
+
+
+class ReachabilityMap(object):
+    """
+    Voxel grid with one bit per tool direction telling if the voxel centre is reachable with it
+
+    Args:
+        model: String. Robot model, a key of kinematics.DH_PARAMETERS
+        tcp: (4,4) array. Transformation from the flange to the tool center point, None for the flange
+        resolution: float. Voxel size in mm
+        n_directions: Integer. Number of sampled tool directions, at most 64. Tool directions are
+            quantized to these, more directions and a finer resolution make the map more accurate
+    """
+
+    def __init__(self, model="UR5", tcp=None, resolution=RESOLUTION, n_directions=DIRECTIONS):
+        if not 0 < n_directions <= 64:
+            raise ValueError("Between 1 and 64 directions are supported")
+        self.model = model
+        self.tcp = None if tcp is None else np.asarray(tcp, dtype=float)
+        self.resolution = float(resolution)
+        self.directions = sphere_directions(n_directions)
+        table = kinematics.dh_table(model)
+        reach = _reach(table, self.tcp)
+        # the grid is centred on the shoulder, above the base
+        self.shape = (int(np.ceil(2 * reach / self.resolution)),) * 3
+        self.origin = np.array((0.0, 0.0, table[0, 0])) - reach
+        self.bits = None
+
+    def key(self):
+        """
+        Returns:
+            key: String identifying robot model, TCP and sampling, used as cache file name
+        """
+        h = hashlib.sha1()
+        h.update(("%d %s %r %d" % (VERSION, self.model, self.resolution, len(self.directions))).encode("utf-8"))
+        h.update(kinematics.dh_table(self.model).tobytes())
+        if self.tcp is not None:
+            h.update(self.tcp.tobytes())
+        return "%s_%s" % (self.model, h.hexdigest()[:16])
+
+    def centres(self):
+        """
+        Returns:
+            centres: (X,Y,Z,3) array of the voxel centres in mm
+        """
+        axes = [self.origin[i] + self.resolution * (np.arange(n) + 0.5) for i, n in enumerate(self.shape)]
+        return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+
+    def build(self, chunk_size=CHUNK_SIZE):
+        """
+        Tests every voxel centre and direction with inverse kinematics
+        """
+        centres = self.centres().reshape(-1, 3)
+        rotations = _rotations(self.directions)
+        k = len(rotations)
+        bits = np.zeros(len(centres), dtype=np.uint64)
+        # voxels out of reach of the arm are skipped
+        shoulder = np.array((0.0, 0.0, kinematics.dh_table(self.model)[0, 0]))
+        candidates = np.nonzero(np.linalg.norm(centres - shoulder, axis=1) <= _reach(kinematics.dh_table(self.model), self.tcp))[0]
+        weights = np.left_shift(np.uint64(1), np.arange(k, dtype=np.uint64))
+
+        step = max(1, chunk_size // k)
+        for start in range(0, len(candidates), step):
+            index = candidates[start:start + step]
+            targets = np.zeros((len(index), k, 4, 4))
+            targets[:, :, :3, :3] = rotations
+            targets[:, :, :3, 3] = centres[index][:, None]
+            targets[:, :, 3, 3] = 1.0
+            solutions = kinematics.inverse_kinematics(targets.reshape(-1, 4, 4), self.model, self.tcp)
+            reachable = ~np.isnan(solutions).any(axis=2)
+            reachable = reachable.any(axis=1).reshape(len(index), k)
+            bits[index] = np.bitwise_or.reduce(np.where(reachable, weights, np.uint64(0)), axis=1)
+        self.bits = bits.reshape(self.shape)
+        return self
+
+    def _voxels(self, points):
+        """
+        Returns:
+            index: (N,3) voxel indices of the points
+            inside: (N,) boolean array, False for points outside the grid
+        """
+        index = np.floor((np.asarray(points, dtype=float).reshape(-1, 3) - self.origin) / self.resolution).astype(int)
+        inside = ((index >= 0) & (index < self.shape)).all(axis=1)
+        return np.where(inside[:, None], index, 0), inside
+
+    def reachable(self, planes):
+        """
+        Looks planes up in the map, at the voxel of the origin and the sampled direction closest to
+        the z axis, see the module docstring for the accuracy
+
+        Args:
+            planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+
+        Returns:
+            reachable: (N,) boolean array
+        """
+        origins, rotations = batch_utils.planes_to_frames(planes)
+        index, inside = self._voxels(origins)
+        direction = np.argmax(np.dot(rotations[:, :, 2], self.directions.T), axis=1).astype(np.uint64)
+        bits = self.bits[index[:, 0], index[:, 1], index[:, 2]]
+        return inside & ((bits >> direction) & np.uint64(1)).astype(bool)
+
+    def coverage(self, points):
+        """
+        Args:
+            points: (N,3) array of positions in mm
+
+        Returns:
+            coverage: (N,) array, share of the tool directions that reach each point
+        """
+        index, inside = self._voxels(points)
+        bits = self.bits[index[:, 0], index[:, 1], index[:, 2]]
+        counts = np.unpackbits(bits.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        return np.where(inside, counts / float(len(self.directions)), 0.0)
+
+    def save(self, path):
+        np.savez_compressed(path, bits=self.bits, key=np.array(self.key()))
+
+    def load(self, path):
+        """
+        Reads the bits of a saved map with the same key
+        """
+        with np.load(path) as data:
+            if str(data["key"]) != self.key():
+                raise ValueError("%s was built for a different robot, TCP or sampling" % path)
+            self.bits = data["bits"]
+        return self
+
+
+def reachability_map(model="UR5", tcp=None, resolution=RESOLUTION, n_directions=DIRECTIONS, cache_dir=CACHE_DIR):
+    """
+    Returns the reachability map from the cache, building and caching it on the first call
+
+    Args:
+        model: String. Robot model, a key of kinematics.DH_PARAMETERS
+        tcp: (4,4) array. Transformation from the flange to the tool center point, None for the flange
+        resolution: float. Voxel size in mm
+        n_directions: Integer. Number of sampled tool directions, at most 64
+        cache_dir: String. Folder of the cached maps, None to always build
+
+    Returns:
+        reachability: ReachabilityMap
+    """
+    reachability = ReachabilityMap(model, tcp, resolution, n_directions)
+    if cache_dir is None:
+        return reachability.build()
+    path = os.path.join(cache_dir, reachability.key() + ".npz")
+    if os.path.exists(path):
+        return reachability.load(path)
+    reachability.build()
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    reachability.save(path)
+    return reachability
@@ -1,6 +1,32 @@
+import collections
+import math
+import select
 import socket
+import threading
+import time
+import traceback
 from struct import *
 
+import instrumentation as instr
+
+SCRIPT_PORT = 30002
+CONNECT_TIMEOUT = 2
+MAX_SCRIPT_SIZE = 2<<18
+
+RT_PORT = 30003
+RT_RECONNECT_DELAY = 0.5
+# Packets of the real time interface are at least up to the controller timer long, whatever the software version
+RT_MIN_PACKET_SIZE = 756
+RT_MAX_PACKET_SIZE = 4096
+# Byte offsets of the fields we read from a real time packet, every field is a big endian double
+RT_OFFSETS = {
+    "target_joints": 12,
+    "actual_joints": 252,
+    "forces": 540,
+    "pose": 588,
+    "time": 740,
+}
+
 def concatenate_script(list_ur_commands):
     """
     Internal function that concatenates generated UR script into one large script file. Usually used to combine
@@ -13,57 +39,296 @@ def concatenate_script(list_ur_commands):
         ur_script: The concatenated script
     """
 
-    ur_script = "\ndef my_script():\n"
-    #ur_script += '\tpopup("running my_script")\n'
+    with instr.timer("assembly"):
+        ur_script = ScriptBuilder(list_ur_commands).build()
+    return ur_script
+
+class ScriptBuilder(object):
+    """
+    Collects UR script commands and emits the wrapped, indented program lazily, line by line.
+    Building is linear in the program size and the program can be written to a socket or file
+    without materializing it as one string.
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one script string
+        name: String. Name of the wrapping UR script function
+    """
+
+    def __init__(self, list_ur_commands=None, name="my_script"):
+        self.name = name
+        self.commands = []
+        if list_ur_commands is not None:
+            self.extend(list_ur_commands)
 
-    combined_script = ""
-    for ur_cmd in list_ur_commands:
-        combined_script += ur_cmd
+    def add(self, ur_cmd):
+        self.commands.append(ur_cmd)
+        return self
 
-    #format combined script
-    lines =  combined_script.split("\n")
-    for l in lines:
-        ur_script += "\t" + l + "\n"
+    def extend(self, list_ur_commands):
+        if isinstance(list_ur_commands, (str, bytes)):
+            self.commands.append(list_ur_commands)
+        else:
+            self.commands.extend(list_ur_commands)
+        return self
 
-    ur_script += 'end\n'
-    ur_script += '\nmy_script()\n'
-    return ur_script
+    def lines(self):
+        """
+        Generator over the lines of the program, each indented into the wrapping function.
+        Commands do not need to end with a newline, a line may span several commands.
+        """
+        yield "\ndef %s():\n" % self.name
+        #yield '\tpopup("running my_script")\n'
+        pending = []
+        for ur_cmd in self.commands:
+            parts = ur_cmd.split("\n")
+            if len(parts) == 1:
+                pending.append(ur_cmd)
+                continue
+            pending.append(parts[0])
+            yield "\t" + "".join(pending) + "\n"
+            for l in parts[1:-1]:
+                yield "\t" + l + "\n"
+            pending = [parts[-1]]
+        yield "\t" + "".join(pending) + "\n"
+        yield "end\n"
+        yield "\n%s()\n" % self.name
+
+    def chunks(self, size=65536):
+        """
+        Generator over pieces of the program of about size characters, e.g. for socket writes
+        """
+        buf = []
+        n = 0
+        for line in self.lines():
+            buf.append(line)
+            n += len(line)
+            if n >= size:
+                yield "".join(buf)
+                buf = []
+                n = 0
+        if buf:
+            yield "".join(buf)
+
+    def __len__(self):
+        n = 0
+        for line in self.lines():
+            n += len(line)
+        return n
+
+    def build(self):
+        """
+        Returns:
+            ur_script: the whole program as one string
+        """
+        # same result as joining lines(), without a Python level loop over the lines
+        body = "".join(self.commands).replace("\n", "\n\t")
+        return "\ndef %s():\n\t%s\nend\n\n%s()\n" % (self.name, body, self.name)
+
+    def write_to(self, f):
+        """
+        Writes the program to an open file in text mode
+        """
+        for chunk in self.chunks():
+            f.write(chunk)
+
+    def send(self, sock):
+        """
+        Writes the program to a connected socket
+        """
+        for chunk in self.chunks():
+            sock.sendall(_to_bytes(chunk))
+
+class RobotConnection(object):
+    """
+    A persistent TCP connection to the script port of one robot.
+    The socket is opened lazily and reopened transparently if the controller drops it.
+    """
+
+    def __init__(self, robot_ip, port=SCRIPT_PORT, timeout=CONNECT_TIMEOUT):
+        self.robot_ip = robot_ip
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Opens the socket to the robot if it is not open yet
+
+        Returns:
+            sock: the connected socket
+        """
+        if self.sock is None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.settimeout(self.timeout)
+            try:
+                with instr.timer("connect"):
+                    s.connect((self.robot_ip, self.port))
+            except:
+                s.close()
+                raise
+            s.settimeout(None)
+            self.sock = s
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+
+    def _is_alive(self):
+        """
+        Discards the state messages the controller pushes on the script port, so the receive
+        buffer never fills up, and detects a connection that was closed on the robot side.
+        """
+        try:
+            while True:
+                readable, _, _ = select.select([self.sock], [], [], 0)
+                if not readable:
+                    return True
+                if not self.sock.recv(4096):
+                    return False
+        except (socket.error, select.error, ValueError):
+            return False
+
+    def send(self, script_to_send):
+        """
+        Sends a script over the warm connection, reconnecting once if the socket went stale
+
+        Args:
+            script_to_send: Script to send to socket
+        """
+        with self.lock:
+            if self.sock is not None and not self._is_alive():
+                self.close()
+            try:
+                self._send(self.connect(), script_to_send)
+            except socket.error:
+                # the connection went stale since the last program, retry once on a fresh socket
+                self.close()
+                self._send(self.connect(), script_to_send)
+
+    def _send(self, sock, script_to_send):
+        with instr.timer("send"):
+            if isinstance(script_to_send, ScriptBuilder):
+                script_to_send.send(sock)
+            else:
+                sock.sendall(_to_bytes(script_to_send))
+
+
+class ConnectionPool(object):
+    """
+    Keeps one RobotConnection per robot IP, so repeated sends from Grasshopper components
+    and Fabrication.send reuse the same socket instead of a new handshake per program.
+    """
+
+    def __init__(self, port=SCRIPT_PORT, timeout=CONNECT_TIMEOUT):
+        self.port = port
+        self.timeout = timeout
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def get(self, robot_ip):
+        with self.lock:
+            connection = self.connections.get(robot_ip)
+            if connection is None:
+                connection = RobotConnection(robot_ip, self.port, self.timeout)
+                self.connections[robot_ip] = connection
+            return connection
+
+    def send(self, script_to_send, robot_ip):
+        self.get(robot_ip).send(script_to_send)
+
+    def close(self, robot_ip=None):
+        """
+        Closes the connection to one robot, or all connections if no IP is given
+        """
+        with self.lock:
+            if robot_ip is None:
+                ips = list(self.connections.keys())
+            else:
+                ips = [robot_ip]
+            for ip in ips:
+                connection = self.connections.pop(ip, None)
+                if connection is not None:
+                    connection.close()
+
+
+# Module level pool. Grasshopper keeps imported modules alive between solves, so the sockets stay warm
+POOL = ConnectionPool()
+
+def _to_bytes(script):
+    if not isinstance(script, bytes):
+        script = script.encode("utf-8")
+    return script
+
+def send_script(script_to_send, robot_ip, pooled=True):
+    """
+    Sends a script to the Robot, reusing a pooled connection to that robot
+
+    Args:
+        script_to_send: Script to send to socket, a string or a ScriptBuilder
+        robot_ip: String. IP address of the robot
+        pooled: Boolean. If False a fresh socket is opened and closed for this script only
+
+    """
+    n=len(script_to_send)
+    if n>MAX_SCRIPT_SIZE:
+        raise Exception("Program too long, use streaming.stream_program for long jobs")
+
+    if not pooled:
+        send_script_once(script_to_send, robot_ip)
+        return
+
+    try:
+        POOL.send(script_to_send, robot_ip)
+    except socket.error:
+        print ("Cannot send to ",robot_ip,SCRIPT_PORT)
 
-def send_script(script_to_send,robot_ip):
+def send_script_once(script_to_send,robot_ip,port=SCRIPT_PORT):
     """
-    Opens a socket to the Robot and sends a script
+    Opens a socket to the Robot, sends a script and closes the socket again
 
     Args:
-        script_to_send: Script to send to socket
-        robot_id: Integer. ID of robot
+        script_to_send: Script to send to socket, a string or a ScriptBuilder
+        robot_ip: String. IP address of the robot
+        port: Integer. Script port of the controller
 
     """
 
     '''Function that opens a socket connection to the robot'''
-    PORT = 30002
+    PORT = port
     HOST = robot_ip
 
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(2)
+    s.settimeout(CONNECT_TIMEOUT)
     try:
-        s.connect((HOST, PORT))
-    except:
+        with instr.timer("connect"):
+            s.connect((HOST, PORT))
+    except socket.error:
         print ("Cannot connect to ",HOST,PORT)
 
     s.settimeout(None)
-    max_size= 2<<18
     n=len(script_to_send)
-    if n>max_size:
+    if n>MAX_SCRIPT_SIZE:
         raise Exception("Program too long")
 
     try:
-        s.send(script_to_send)
-    except:
+        with instr.timer("send"):
+            if isinstance(script_to_send, ScriptBuilder):
+                script_to_send.send(s)
+            else:
+                s.send(_to_bytes(script_to_send))
+    except socket.error:
         print("failed to send")
     s.close()
 
 def listen_to_robot(robot_ip):
-    PORT = 30003
+    PORT = RT_PORT
     HOST = robot_ip
     # Create dictionary to store data
     chunks={}
@@ -74,12 +339,13 @@ def listen_to_robot(robot_ip):
     chunks["time"] = [0]
 
     data = read(HOST, PORT)
-    get_messages(data, chunks)
+    with instr.timer("decode"):
+        get_messages(data, chunks)
     return chunks
 
 def read(HOST, PORT):
     """
-    Method that opens a TCP socket to the robot, receives data from the robot server and then closes socket
+    Method that opens a TCP socket to the robot, receives one complete packet from the robot server and then closes socket
 
     Returns:
         data: Data broadcast by the robot. In bytes
@@ -88,16 +354,73 @@ def read(HOST, PORT):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.settimeout(1)
     try:
-        s.connect((HOST, PORT))
-        print "connected"
+        with instr.timer("connect"):
+            s.connect((HOST, PORT))
+        print ("connected")
     except:
         traceback.print_exc()
-        print "Cannot connect to ",HOST,PORT
+        print ("Cannot connect to ",HOST,PORT)
     s.settimeout(None)
-    data = s.recv(1024)
+    with instr.timer("recv"):
+        data = recv_packet(s)
     s.close()
     return data
 
+def _recv_exactly(s, n):
+    data = b""
+    while len(data) < n:
+        chunk = s.recv(n - len(data))
+        if not chunk:
+            raise socket.error("Connection closed by robot")
+        data += chunk
+    return data
+
+def recv_packet(s):
+    """
+    Receives one length-prefixed packet of the real time interface from a connected socket
+
+    Returns:
+        packet: the complete packet including its 4 byte size header
+    """
+    header = _recv_exactly(s, 4)
+    size = unpack("!i", header)[0]
+    if not RT_MIN_PACKET_SIZE <= size <= RT_MAX_PACKET_SIZE:
+        raise ValueError("Invalid packet size %s" % size)
+    return header + _recv_exactly(s, size - 4)
+
+def split_packets(buf):
+    """
+    Splits a byte stream of the real time interface into complete packets
+
+    Args:
+        buf: bytes received from the robot, starting at a packet boundary
+
+    Returns:
+        packets: list of complete packets
+        rest: trailing bytes of an incomplete packet
+    """
+    packets = []
+    offset = 0
+    n = len(buf)
+    while n - offset >= 4:
+        size = unpack_from("!i", buf, offset)[0]
+        if not RT_MIN_PACKET_SIZE <= size <= RT_MAX_PACKET_SIZE:
+            raise ValueError("Invalid packet size %s" % size)
+        if n - offset < size:
+            break
+        packets.append(buf[offset:offset + size])
+        offset += size
+    return packets, buf[offset:]
+
+def decode_packet(packet):
+    """
+    Decodes one real time packet into a new dictionary with the same keys as listen_to_robot
+    """
+    sample = {}
+    with instr.timer("decode"):
+        get_messages(packet, sample)
+    return sample
+
 def get_messages(bytes, chunks_info):
     """
     Function parses data stream and selects the following information:
@@ -111,26 +434,146 @@ def get_messages(bytes, chunks_info):
     for more info see: http://wiki03.lynero.net/Technical/RealTimeClientInterface
     """
 
-
-    # get messages
-    q_target = bytes[12:60]
-    q_actual = bytes[252:300]
-    tcp_force = bytes[540:588]
-    tool_vector = bytes[588:636]
-    controller_time = bytes[740:748]
-
     # format type: int,
     fmt_double6 = "!dddddd"
     fmt_double1 = "!d"
 
     #Unpack selected data
-    target_joints = unpack(fmt_double6,q_target)
-    chunks_info["target_joints"]= (math.degrees(j) for j in target_joints)
-    actual_joints = unpack(fmt_double6,q_actual)
-    chunks_info["actual_joints"]= (math.degrees(j) for j in actual_joints)
-    forces = unpack(fmt_double6,tcp_force)
+    target_joints = unpack_from(fmt_double6,bytes,RT_OFFSETS["target_joints"])
+    chunks_info["target_joints"]= [math.degrees(j) for j in target_joints]
+    actual_joints = unpack_from(fmt_double6,bytes,RT_OFFSETS["actual_joints"])
+    chunks_info["actual_joints"]= [math.degrees(j) for j in actual_joints]
+    forces = unpack_from(fmt_double6,bytes,RT_OFFSETS["forces"])
     chunks_info["forces"]= forces
-    pose = unpack(fmt_double6,tool_vector)
+    pose = unpack_from(fmt_double6,bytes,RT_OFFSETS["pose"])
     chunks_info["pose"]= pose
-    time = unpack(fmt_double1,controller_time)
+    time = unpack_from(fmt_double1,bytes,RT_OFFSETS["time"])
     chunks_info["time"]= time
+
+
+class RingBuffer(object):
+    """
+    Bounded, thread safe buffer of telemetry samples. When full, the oldest samples are
+    overwritten and counted in dropped. Reading never blocks the producer for longer than a copy.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.items = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.total = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def append(self, item):
+        with self.lock:
+            if len(self.items) == self.capacity:
+                self.dropped += 1
+            self.items.append(item)
+            self.total += 1
+
+    def latest(self):
+        """
+        Returns:
+            the most recent sample without removing it, None if the buffer is empty
+        """
+        with self.lock:
+            if self.items:
+                return self.items[-1]
+            return None
+
+    def drain(self):
+        """
+        Returns:
+            all buffered samples, oldest first, and empties the buffer
+        """
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+        return items
+
+
+class TelemetryStreamer(object):
+    """
+    Background reader of the real time interface. Keeps one connection open, reassembles the
+    length-prefixed packets at the full controller rate and publishes decoded samples into a
+    RingBuffer. Consumers call latest() or drain() and never wait on the network.
+
+    Args:
+        robot_ip: String. IP address of the robot
+        port: Integer. Real time port of the controller
+        capacity: Integer. Number of samples kept in the ring buffer
+        decode: function turning one packet into a sample, decode_packet by default
+    """
+
+    def __init__(self, robot_ip, port=RT_PORT, capacity=1000, decode=decode_packet):
+        self.robot_ip = robot_ip
+        self.port = port
+        self.decode = decode
+        self.buffer = RingBuffer(capacity)
+        self.packets = 0
+        self.reconnects = 0
+        self.connected = False
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def latest(self):
+        return self.buffer.latest()
+
+    def drain(self):
+        return self.buffer.drain()
+
+    def _run(self):
+        while self.running:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(CONNECT_TIMEOUT)
+            try:
+                s.connect((self.robot_ip, self.port))
+                self.connected = True
+                self._read_loop(s)
+            except (socket.error, ValueError):
+                pass
+            finally:
+                self.connected = False
+                s.close()
+            if self.running:
+                self.reconnects += 1
+                time.sleep(RT_RECONNECT_DELAY)
+
+    def _read_loop(self, s):
+        # a short timeout lets stop() end the thread while the robot is silent
+        s.settimeout(0.2)
+        rest = b""
+        while self.running:
+            try:
+                data = s.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            packets, rest = split_packets(rest + data)
+            for packet in packets:
+                self.buffer.append(self.decode(packet))
+            self.packets += len(packets)
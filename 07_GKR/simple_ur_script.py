@@ -1,17 +1,139 @@
 """
 This module wraps standard UR Script functions.
 Main change is that plane infromation substitute for pose data
+
+Every function returns its UR script. When a motion_program.MotionProgram is passed as program=,
+the command is appended to the program instead and an empty string is returned.
 """
 
+import collections
+
+import profiling
 import utils
-import Rhino.Geometry as rg
+from geometry import rg
+
+# NumPy is optional, it is only needed for the batch functions
+try:
+    import numpy as np
+    import batch_utils
+    import path_analysis
+except ImportError:
+    np = None
 
 # Some Constants
 MAX_ACCEL = 1.5
 MAX_VELOCITY = 2
 
+POSE_CACHE_SIZE = 4096
+# Cache keys are quantized far below the 0.1 mm and 1e-4 rad resolution of the formatted poses
+POSITION_QUANTUM = 1e-4
+AXIS_QUANTUM = 1e-9
+
+
+class PoseCache(object):
+    """
+    Bounded LRU cache of poses, as formatted strings and as values. Jobs repeating the same planes (pick up plane,
+    safe planes, TCP) compute each pose only once.
+
+    Args:
+        maxsize: Integer. Number of poses kept, the least recently used one is evicted first
+    """
+
+    def __init__(self, maxsize=POSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.poses = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # lookups made while computing a miss, e.g. the values of a formatted pose, are not counted
+        self._computing = 0
+
+    def get(self, key, compute, *args):
+        """
+        Returns the pose cached under key, computing it as compute(*args) on a miss
+        """
+        pose = self.poses.pop(key, None)
+        outer = not self._computing
+        if pose is None:
+            if outer:
+                self.misses += 1
+            self._computing += 1
+            try:
+                pose = compute(*args)
+            finally:
+                self._computing -= 1
+            if len(self.poses) >= self.maxsize:
+                self.poses.popitem(last=False)
+        elif outer:
+            self.hits += 1
+        self.poses[key] = pose
+        return pose
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.poses), "maxsize": self.maxsize}
+
+    def clear(self):
+        self.poses.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+POSE_CACHE = PoseCache()
+
+def pose_cache_info():
+    """
+    Returns:
+        info: dictionary with hits, misses, size and maxsize of the pose cache
+    """
+    return POSE_CACHE.info()
+
+def _q(value, quantum):
+    return int(round(value / quantum))
+
+def _plane_key(plane):
+    o, x, y = plane.Origin, plane.XAxis, plane.YAxis
+    return (_q(o.X, POSITION_QUANTUM), _q(o.Y, POSITION_QUANTUM), _q(o.Z, POSITION_QUANTUM),
+            _q(x.X, AXIS_QUANTUM), _q(x.Y, AXIS_QUANTUM), _q(x.Z, AXIS_QUANTUM),
+            _q(y.X, AXIS_QUANTUM), _q(y.Y, AXIS_QUANTUM), _q(y.Z, AXIS_QUANTUM))
+
+_POSE_FMT = "p[" + ("%.4f,"*6)[:-1]+"]"
+
+def _plane_pose_values(plane_to):
+    _matrix = rg.Transform.PlaneToPlane(rg.Plane.WorldXY,plane_to)
+    _axis_angle= utils.matrix_to_axis_angle(_matrix)
+    # Create pose data
+    return (plane_to.OriginX/1000, plane_to.OriginY/1000, plane_to.OriginZ/1000,
+            float(_axis_angle[0]), float(_axis_angle[1]), float(_axis_angle[2]))
+
+def _format_plane_pose(plane_to):
+    return _POSE_FMT%plane_pose_values(plane_to)
+
+def plane_pose_values(plane_to):
+    """
+    UR pose of a plane, cached in POSE_CACHE
+
+    Args:
+        plane_to: Rhino.Geometry Plane. (in UR base coordinate system)
+
+    Returns:
+        pose: tuple x, y, z in m and the axis-angle rotation
+    """
+    return POSE_CACHE.get(("values",) + _plane_key(plane_to), _plane_pose_values, plane_to)
 
-def move_l(plane_to, accel, vel):
+def plane_pose(plane_to):
+    """
+    Formatted UR pose of a plane, cached in POSE_CACHE
+
+    Args:
+        plane_to: Rhino.Geometry Plane. (in UR base coordinate system)
+
+    Returns:
+        pose: String. UR pose literal p[x, y, z, rx, ry, rz]
+    """
+    return POSE_CACHE.get(("plane",) + _plane_key(plane_to), _format_plane_pose, plane_to)
+
+
+@profiling.profiled("ur.move_l")
+def move_l(plane_to, accel, vel, program=None):
     """
     Function that returns UR script for linear movement in tool-space.
 
@@ -19,6 +141,7 @@ def move_l(plane_to, accel, vel):
         plane_to: Rhino.Geometry Plane. A target plane for calculating pose (in UR base coordinate system)
         accel: tool accel in m/s^2
         vel: tool speed in m/s
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
@@ -28,47 +151,43 @@ def move_l(plane_to, accel, vel):
     accel = MAX_ACCEL if (abs(accel) >MAX_ACCEL) else abs(accel)
     vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
 
-    _matrix = rg.Transform.PlaneToPlane(rg.Plane.WorldXY,plane_to)
-    _axis_angle= utils.matrix_to_axis_angle(_matrix)
-    # Create pose data
-    _pose = [plane_to.OriginX/1000, plane_to.OriginY/1000, plane_to.OriginZ/1000,_axis_angle[0], _axis_angle[1], _axis_angle[2]]
-    _pose_fmt = "p[" + ("%.4f,"*6)[:-1]+"]"
-    _pose_fmt = _pose_fmt%tuple(_pose)
+    if program is not None:
+        program.move_l(plane_pose_values(plane_to), accel, vel)
+        return ""
+    _pose_fmt = plane_pose(plane_to)
     # Format UR script
     script = "movel(%s, a = %.2f, v = %.2f)\n"%(_pose_fmt,accel,vel)
     return script
 
 
-def move_l_blend(plane_to, vel, blend_radius = 0):
+def move_l_blend(plane_to, vel, blend_radius = 0, program=None):
     """
     Function that returns UR script for linear movement in tool-space.
 
     Args:
         plane_to: Rhino.Geometry Plane. A target plane for calculating pose (in UR base coordinate system)
-        accel: tool accel in m/s^2
         vel: tool speed in m/s
+        blend_radius: blend radius in m
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
 
-    # Check acceleration and velocity are non-negative and below a set limit
-    accel = MAX_ACCEL if (abs(accel) >MAX_ACCEL) else abs(accel)
+    # Check velocity is non-negative and below a set limit
     vel = MAX_VELOCITY if (abs(vel) > MAX_VELOCITY) else abs(vel)
     # Check blend radius is positive
     blend_radius = max(0, blend_radius)
 
-    _matrix = rg.Transform.PlaneToPlane(rg.Plane.WorldXY,plane_to)
-    _axis_angle= utils.matrix_to_axis_angle(_matrix)
-    # Create pose data
-    _pose = [plane_to.OriginX/1000, plane_to.OriginY/1000, plane_to.OriginZ/1000,_axis_angle[0], _axis_angle[1], _axis_angle[2]]
-    _pose_fmt = "p[" + ("%.4f,"*6)[:-1]+"]"
-    _pose_fmt = _pose_fmt%tuple(_pose)
+    if program is not None:
+        program.move_l_blend(plane_pose_values(plane_to), vel, blend_radius)
+        return ""
+    _pose_fmt = plane_pose(plane_to)
     # Format UR script
     script = "movel(%s, v = %.2f, r = %.4f)\n"%(_pose_fmt,  vel, blend_radius)
     return script
 
-def move_j(joints, accel, vel):
+def move_j(joints, accel, vel, program=None):
     """
     Function that returns UR script for linear movement in joint space.
 
@@ -77,18 +196,22 @@ def move_j(joints, accel, vel):
         accel: tool accel in m/s^2
         accel: tool accel in m/s^2
         vel: tool speed in m/s
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
     # Check acceleration and velocity are non-negative and below a set limit
 
+    if program is not None:
+        program.move_j(joints, accel, vel)
+        return ""
     _j_fmt = "[" + ("%.2f,"*6)[:-1]+"]"
     _j_fmt = _j_fmt%tuple(joints)
     script = "movej(%s, a = %.2f, v = %.2f)\n"%(_j_fmt,accel,vel)
     return script
 
-def set_tcp_by_plane(x_offset, y_offset, z_offset, ref_plane=rg.Plane.WorldXY):
+def set_tcp_by_plane(x_offset, y_offset, z_offset, ref_plane=rg.Plane.WorldXY, program=None):
     """
     TODO: Need to test if this gives the correct result
     Function that returns UR script for setting tool center point
@@ -98,26 +221,33 @@ def set_tcp_by_plane(x_offset, y_offset, z_offset, ref_plane=rg.Plane.WorldXY):
         y_offset: float. tooltip offset in mm
         z_offset: float. tooltip offset in mm
         ref_plane: Plane that defines orientation of the tip. If none specified, world XY plane used as default. (in UR base coordinate system)
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
 
+    _key = ("tcp_plane", _q(x_offset, POSITION_QUANTUM), _q(y_offset, POSITION_QUANTUM), _q(z_offset, POSITION_QUANTUM)) + _plane_key(ref_plane)
+    _pose = POSE_CACHE.get(_key, _tcp_by_plane_values, x_offset, y_offset, z_offset, ref_plane)
+
+    if program is not None:
+        program.set_tcp(_pose)
+        return ""
+    # Format UR script
+    _pose_fmt = _POSE_FMT%_pose
+    script = "set_tcp(%s)\n"%(_pose_fmt)
+    return script
+
+def _tcp_by_plane_values(x_offset, y_offset, z_offset, ref_plane):
     if (ref_plane != rg.Plane.WorldXY):
         _matrix = rg.Transform.PlaneToPlane(rg.Plane.WorldXY,ref_plane)
         _axis_angle= utils.matrix_to_axis_angle(_matrix)
     else:
         _axis_angle = rg.Vector3d(0,0,0)
     # Create pose data
-    _pose = [x_offset/1000, y_offset/1000, z_offset/1000,_axis_angle[0], _axis_angle[1], _axis_angle[2]]
-    _pose_fmt = "p[" + ("%.4f,"*6)[:-1]+"]"
-    _pose_fmt = _pose_fmt%tuple(_pose)
+    return (x_offset/1000, y_offset/1000, z_offset/1000, float(_axis_angle[0]), float(_axis_angle[1]), float(_axis_angle[2]))
 
-    # Format UR script
-    script = "set_tcp(%s)\n"%(_pose_fmt)
-    return script
-
-def set_tcp_by_angles(x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate):
+def set_tcp_by_angles(x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate, program=None):
     """
     Function that returns UR script for setting tool center point
 
@@ -128,11 +258,25 @@ def set_tcp_by_angles(x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate
         x_rotation: float. rotation around world x axis in radians
         y_rotation: float. rotation around world y axis in radians
         z_rotation: float. rotation around world z axis in radians
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
 
+    _key = ("tcp_angles",) + tuple([_q(v, POSITION_QUANTUM) for v in (x_offset, y_offset, z_offset)]) + \
+        tuple([_q(v, AXIS_QUANTUM) for v in (x_rotate, y_rotate, z_rotate)])
+    _pose = POSE_CACHE.get(_key, _tcp_by_angles_values, x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate)
+
+    if program is not None:
+        program.set_tcp(_pose)
+        return ""
+    # Format UR script
+    _pose_fmt = _POSE_FMT%_pose
+    script = "set_tcp(%s)\n"%(_pose_fmt)
+    return script
+
+def _tcp_by_angles_values(x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate):
     #Create rotation matrix
     _rX = rg.Transform.Rotation(x_rotate, rg.Vector3d(1,0,0), rg.Point3d(0,0,0))
     _rY = rg.Transform.Rotation(y_rotate, rg.Vector3d(0,1,0), rg.Point3d(0,0,0))
@@ -141,53 +285,156 @@ def set_tcp_by_angles(x_offset, y_offset, z_offset, x_rotate, y_rotate, z_rotate
     _axis_angle= utils.matrix_to_axis_angle(_r)
 
     # Create pose data
-    _pose = [x_offset/1000, y_offset/1000, z_offset/1000,_axis_angle[0], _axis_angle[1], _axis_angle[2]]
-    _pose_fmt = "p[" + ("%.4f,"*6)[:-1]+"]"
-    _pose_fmt = _pose_fmt%tuple(_pose)
-
-    # Format UR script
-    script = "set_tcp(%s)\n"%(_pose_fmt)
-    return script
+    return (x_offset/1000, y_offset/1000, z_offset/1000, float(_axis_angle[0]), float(_axis_angle[1]), float(_axis_angle[2]))
 
-def popup(message, title):
+def popup(message, title, program=None):
     """
     Function that returns UR script for popup
 
     Args:
         message: float. tooltip offset in mm
         title: float. tooltip offset in mm
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
+    if program is not None:
+        program.popup(message, title)
+        return ""
     script = 'popup("%s","%s") \n' %(message,title)
     return script
 
-def sleep(time):
+def sleep(time, program=None):
     """
     Function that returns UR script for sleep()
 
     Args:
         time: float.in s
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
+    if program is not None:
+        program.sleep(time)
+        return ""
     script = "sleep(%s) \n" %(time)
     return script
 
-def set_digital_out(id, signal):
+def set_digital_out(id, signal, program=None):
     """
     Function that returns UR script for setting digital out
 
     Args:
         id: int. Input id number
         signal: boolean. signal level - on or off
+        program: MotionProgram to append to instead of returning the script
 
     Returns:
         script: UR script
     """
 
+    if program is not None:
+        program.set_digital_out(id, signal)
+        return ""
     # Format UR script
     script = "set_digital_out(%s,%s)\n"%(id,signal)
     return script
+
+# ----- Batch functions, need NumPy -----
+
+def poses_from_planes(planes):
+    """
+    Computes UR poses for many planes in one NumPy pass. Rotations close to a half turn are exact,
+    where utils.matrix_to_axis_angle rounds them to pi
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+
+    Returns:
+        poses: (N,6) array of x, y, z in m and the axis-angle rotation
+    """
+    if np is None:
+        raise ImportError("Batch functions need NumPy")
+    origins, rotations = batch_utils.planes_to_frames(planes)
+    poses = np.empty((len(origins), 6))
+    poses[:, :3] = origins / 1000
+    poses[:, 3:] = batch_utils.matrices_to_axis_angles(rotations)
+    return poses
+
+def _format_block(line_fmt, columns):
+    """
+    Formats one line per row of the columns with a single % operation
+    """
+    values = np.column_stack(columns)
+    return (line_fmt * len(values)) % tuple(values.ravel().tolist())
+
+def move_l_batch(planes, accel, vel):
+    """
+    Function that returns UR script for linear movements through many planes, see move_l.
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+        accel: tool accel in m/s^2, one value or one per plane
+        vel: tool speed in m/s, one value or one per plane
+
+    Returns:
+        script: UR script
+    """
+    poses = poses_from_planes(planes)
+    n = len(poses)
+    # Check acceleration and velocity are non-negative and below a set limit
+    accel = np.broadcast_to(np.minimum(np.abs(accel), MAX_ACCEL), (n,))
+    vel = np.broadcast_to(np.minimum(np.abs(vel), MAX_VELOCITY), (n,))
+
+    line_fmt = "movel(p[" + ("%.4f,"*6)[:-1] + "], a = %.2f, v = %.2f)\n"
+    return _format_block(line_fmt, (poses, accel, vel))
+
+def move_l_blend_batch(planes, vel, blend_radius = 0):
+    """
+    Function that returns UR script for blended linear movements through many planes, see move_l_blend.
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+        vel: tool speed in m/s, one value or one per plane
+        blend_radius: blend radius in m, one value or one per plane
+
+    Returns:
+        script: UR script
+    """
+    poses = poses_from_planes(planes)
+    n = len(poses)
+    # Check velocity is non-negative and below a set limit and blend radius is positive
+    vel = np.broadcast_to(np.minimum(np.abs(vel), MAX_VELOCITY), (n,))
+    blend_radius = np.broadcast_to(np.maximum(blend_radius, 0), (n,))
+
+    line_fmt = "movel(p[" + ("%.4f,"*6)[:-1] + "], v = %.2f, r = %.4f)\n"
+    return _format_block(line_fmt, (poses, vel, blend_radius))
+
+def move_l_path(planes, vel, accel=MAX_ACCEL, max_blend_radius=0.05, min_vel=0.01):
+    """
+    Function that returns UR script for a blended path through many planes, e.g. a drawing or print path.
+    Blend radii and velocities are chosen from the turning of the path with path_analysis, so the tool
+    slows down in tight corners and stops at sharp corners that cannot be blended.
+
+    Args:
+        planes: list of Rhino.Geometry planes, (N,4,4) array or (origins, xaxes, yaxes) arrays. (in UR base coordinate system)
+        vel: tool speed in m/s on straight segments
+        accel: largest centripetal acceleration in m/s^2 in the blends
+        max_blend_radius: largest blend radius in m
+        min_vel: lowest tool speed in m/s
+
+    Returns:
+        script: UR script
+    """
+    if np is None:
+        raise ImportError("Batch functions need NumPy")
+    origins, rotations = batch_utils.planes_to_frames(planes)
+    blend_radius = path_analysis.blend_radii(origins, max_blend_radius)
+    vel = path_analysis.velocities(origins, min(abs(vel), MAX_VELOCITY), min(abs(accel), MAX_ACCEL), min_vel, blend_radius)
+    frames = np.zeros((len(origins), 4, 4))
+    frames[:, :3, :3] = rotations
+    frames[:, :3, 3] = origins
+    frames[:, 3, 3] = 1.0
+    return move_l_blend_batch(frames, vel, blend_radius)
@@ -0,0 +1,267 @@
+"""
+This module streams motion programs of any length to the robot:
+    1) A small resident URScript connects back to this computer and executes commands one by one
+    2) Commands are sent in bounded segments, the next one only when the previous is nearly finished
+
+Motion commands are sent as fixed size float tuples, so program size no longer limits job size
+and the robot starts moving as soon as the first segment arrives.
+"""
+
+import socket
+import threading
+
+import motion_program as mp
+import simple_comm as c
+
+STREAM_PORT = 30010
+# Number of floats per command: opcode followed by 10 arguments
+COMMAND_SIZE = 11
+
+OP_END = 0
+OP_MOVEL = 1
+OP_MOVEJ = 2
+OP_DIGITAL_OUT = 3
+OP_SLEEP = 4
+OP_SET_TCP = 5
+
+RESIDENT_SCRIPT = """def stream_program():
+    opened = socket_open("%(host)s", %(port)d, "stream")
+    while not opened:
+        sleep(0.5)
+        opened = socket_open("%(host)s", %(port)d, "stream")
+    end
+    while True:
+        cmd = socket_read_ascii_float(%(size)d, "stream")
+        if cmd[0] == %(size)d:
+            op = cmd[1]
+            if op == %(end)d:
+                break
+            elif op == %(movel)d:
+                movel(p[cmd[2], cmd[3], cmd[4], cmd[5], cmd[6], cmd[7]], a = cmd[8], v = cmd[9], r = cmd[10])
+            elif op == %(movej)d:
+                movej([cmd[2], cmd[3], cmd[4], cmd[5], cmd[6], cmd[7]], a = cmd[8], v = cmd[9], r = cmd[10])
+            elif op == %(digital_out)d:
+                set_digital_out(floor(cmd[2]), cmd[3] > 0.5)
+            elif op == %(sleep)d:
+                sleep(cmd[2])
+            elif op == %(set_tcp)d:
+                set_tcp(p[cmd[2], cmd[3], cmd[4], cmd[5], cmd[6], cmd[7]])
+            end
+            socket_send_byte(6, "stream")
+        end
+    end
+    socket_close("stream")
+end
+
+stream_program()
+"""
+
+
+def parse_command(line):
+    """
+    Converts one line of UR script, as generated by simple_ur_script, into a command tuple
+
+    Args:
+        line: String. One UR script statement
+
+    Returns:
+        command: tuple of COMMAND_SIZE floats, None for blank lines and comments
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+
+    for op, regex in ((OP_MOVEL, mp.RE_MOVEL), (OP_MOVEJ, mp.RE_MOVEJ)):
+        match = regex.match(line)
+        if match:
+            values = [float(v) for v in match.group(1).split(",")]
+            kwargs = dict((k, float(v)) for k, v in mp.RE_KWARG.findall(match.group(2)))
+            return _pad([op] + values + [kwargs.get("a", mp.DEFAULT_ACCEL), kwargs.get("v", mp.DEFAULT_VEL), kwargs.get("r", 0.0)])
+
+    match = mp.RE_DIGITAL_OUT.match(line)
+    if match:
+        signal = 1.0 if match.group(2) in ("True", "true", "1") else 0.0
+        return _pad((OP_DIGITAL_OUT, float(match.group(1)), signal))
+
+    match = mp.RE_SLEEP.match(line)
+    if match:
+        return _pad((OP_SLEEP, float(match.group(1))))
+
+    match = mp.RE_SET_TCP.match(line)
+    if match:
+        return _pad([OP_SET_TCP] + [float(v) for v in match.group(1).split(",")])
+
+    raise ValueError("Cannot stream UR script statement: %s" % line)
+
+
+def parse_script(list_ur_commands):
+    """
+    Converts UR script into command tuples
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, or one script string
+
+    Returns:
+        commands: list of command tuples
+    """
+    commands = []
+    # the program wrapper is dropped, any other control flow cannot be streamed
+    for line in mp.script_lines(list_ur_commands):
+        command = parse_command(line)
+        if command is not None:
+            commands.append(command)
+    return commands
+
+
+def program_commands(program):
+    """
+    Converts a motion program into command tuples without going through UR script
+
+    Args:
+        program: motion_program.MotionProgram
+
+    Returns:
+        commands: list of command tuples
+    """
+    commands = []
+    for i in range(len(program)):
+        op = program.op[i]
+        if op == mp.OP_MOVEL:
+            commands.append(_pad((OP_MOVEL,) + program.get_target(i) + (program.accel[i], program.vel[i], program.blend[i])))
+        elif op == mp.OP_MOVEL_BLEND:
+            commands.append(_pad((OP_MOVEL,) + program.get_target(i) + (mp.DEFAULT_ACCEL, program.vel[i], program.blend[i])))
+        elif op == mp.OP_MOVEJ:
+            commands.append(_pad((OP_MOVEJ,) + program.get_target(i) + (program.accel[i], program.vel[i], 0.0)))
+        elif op == mp.OP_SET_TCP:
+            commands.append(_pad((OP_SET_TCP,) + program.get_target(i)))
+        elif op == mp.OP_DIGITAL_OUT:
+            commands.append(_pad((OP_DIGITAL_OUT, float(program.io[i]), program.value[i])))
+        elif op == mp.OP_SLEEP:
+            commands.append(_pad((OP_SLEEP, program.value[i])))
+        else:
+            commands.extend(parse_script(program.render_command(i)))
+    return commands
+
+
+def _pad(values):
+    values = list(values)
+    return tuple(values + [0.0] * (COMMAND_SIZE - len(values)))
+
+
+def _format_command(command):
+    return "(" + ",".join(["%.6f" % v for v in command]) + ")\n"
+
+
+class ScriptStreamer(object):
+    """
+    Streams commands to one robot through the resident script
+
+    Args:
+        robot_ip: String. IP address of the robot
+        host_ip: String. IP address of this computer, as seen from the robot
+        port: Integer. Port the resident script connects back to
+        segment_size: Integer. Number of commands sent at once
+        lookahead: Integer. The next segment is sent once at most this many commands of the previous one are left
+        timeout: float. Seconds to wait for the robot to connect back
+    """
+
+    def __init__(self, robot_ip, host_ip, port=STREAM_PORT, segment_size=50, lookahead=5, timeout=10.0):
+        self.robot_ip = robot_ip
+        self.host_ip = host_ip
+        self.port = port
+        self.segment_size = max(1, segment_size)
+        self.lookahead = max(1, min(lookahead, self.segment_size))
+        self.timeout = timeout
+        self.sent = 0
+        self.acked = 0
+        self.total = 0
+        self.error = None
+        self._thread = None
+
+    def resident_script(self):
+        return RESIDENT_SCRIPT % {
+            "host": self.host_ip, "port": self.port, "size": COMMAND_SIZE, "end": OP_END, "movel": OP_MOVEL,
+            "movej": OP_MOVEJ, "digital_out": OP_DIGITAL_OUT, "sleep": OP_SLEEP, "set_tcp": OP_SET_TCP}
+
+    def stream(self, commands, send=c.send_script):
+        """
+        Sends the resident script and streams all commands, blocking until the robot executed them
+
+        Args:
+            commands: list of command tuples, a MotionProgram, or UR script accepted by parse_script
+            send: function used to upload the resident script, simple_comm.send_script by default
+        """
+        if isinstance(commands, mp.MotionProgram):
+            commands = program_commands(commands)
+        elif not commands or not isinstance(commands[0], tuple):
+            commands = parse_script(commands)
+        self.total = len(commands)
+        self.sent = self.acked = 0
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("", self.port))
+        server.listen(1)
+        server.settimeout(self.timeout)
+        try:
+            send(self.resident_script(), self.robot_ip)
+            conn, _ = server.accept()
+        finally:
+            server.close()
+
+        conn.settimeout(None)
+        try:
+            segment_end = 0
+            while self.acked < self.total:
+                if self.sent < self.total and segment_end - self.acked <= self.lookahead:
+                    segment_end = min(self.sent + self.segment_size, self.total)
+                    conn.sendall(c._to_bytes("".join([_format_command(cmd) for cmd in commands[self.sent:segment_end]])))
+                    self.sent = segment_end
+                acks = conn.recv(4096)
+                if not acks:
+                    raise socket.error("Robot closed the stream after %d of %d commands" % (self.acked, self.total))
+                self.acked += len(acks)
+            conn.sendall(c._to_bytes(_format_command(_pad((OP_END,)))))
+        finally:
+            conn.close()
+
+    def start(self, commands, send=c.send_script):
+        """
+        Streams in a background thread, so a Grasshopper solve is not blocked for the whole job.
+        Progress is available in sent, acked and total, a failure in error.
+        """
+        def run():
+            try:
+                self.stream(commands, send)
+            except Exception as e:
+                self.error = e
+        self.error = None
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+
+
+def stream_program(list_ur_commands, robot_ip, host_ip, port=STREAM_PORT, segment_size=50):
+    """
+    Streams a program of any length to the robot and blocks until it is executed
+
+    Args:
+        list_ur_commands: A list of formatted UR Script strings, one script string or a MotionProgram
+        robot_ip: String. IP address of the robot
+        host_ip: String. IP address of this computer, as seen from the robot
+        port: Integer. Port the resident script connects back to
+        segment_size: Integer. Number of commands sent at once
+    """
+    streamer = ScriptStreamer(robot_ip, host_ip, port, segment_size)
+    streamer.stream(list_ur_commands)
+    return streamer
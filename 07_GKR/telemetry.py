@@ -0,0 +1,315 @@
+"""
+This module contains vectorized tools for telemetry of the real time interface:
+    1) Decoding of buffers holding many packets at once
+    2) Recording decoded samples to memory-mapped column files
+    3) Replaying recordings through the consumer API of simple_comm.TelemetryStreamer
+
+It needs NumPy and is meant for offline processing in CPython, not for GhPython.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import simple_comm as c
+
+# Fields of one real time packet, as offset into the packet and number of big endian doubles
+RT_FIELDS = (
+    ("target_joints", c.RT_OFFSETS["target_joints"], 6),
+    ("actual_joints", c.RT_OFFSETS["actual_joints"], 6),
+    ("forces", c.RT_OFFSETS["forces"], 6),
+    ("pose", c.RT_OFFSETS["pose"], 6),
+    ("time", c.RT_OFFSETS["time"], 1),
+)
+
+# Recordings store every column as little endian doubles in its own file next to a json header
+META_FILE = "meta.json"
+COLUMN_DTYPE = np.dtype("<f8")
+
+
+def rt_dtype(packet_size):
+    """
+    Structured big endian dtype describing one real time packet
+
+    Args:
+        packet_size: Integer. Size of one packet in bytes, as given by its header
+
+    Returns:
+        dtype: numpy dtype with itemsize packet_size
+    """
+    names = ["message_size"]
+    formats = [">i4"]
+    offsets = [0]
+    for name, offset, count in RT_FIELDS:
+        names.append(name)
+        formats.append((">f8", (count,)) if count > 1 else ">f8")
+        offsets.append(offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": packet_size})
+
+
+def decode_packets(buf, packet_size=None):
+    """
+    Decodes a buffer holding consecutive real time packets in one np.frombuffer call.
+    A trailing incomplete packet is ignored.
+
+    Args:
+        buf: bytes, bytearray, memoryview or mmap starting at a packet boundary
+        packet_size: Integer. Size of one packet, read from the first header if None
+
+    Returns:
+        columns: dictionary with the keys of simple_comm.listen_to_robot. target_joints and
+            actual_joints are (N,6) arrays in degrees, forces and pose are (N,6) and time is (N,)
+            big endian views into buf, no data is copied for them
+    """
+    view = memoryview(buf)
+    if packet_size is None:
+        if view.nbytes < 4:
+            return _empty_columns()
+        packet_size = int(np.frombuffer(view, dtype=">i4", count=1)[0])
+    if not c.RT_MIN_PACKET_SIZE <= packet_size <= c.RT_MAX_PACKET_SIZE:
+        raise ValueError("Invalid packet size %s" % packet_size)
+
+    count = view.nbytes // packet_size
+    packets = np.frombuffer(view, dtype=rt_dtype(packet_size), count=count)
+    if count and not (packets["message_size"] == packet_size).all():
+        raise ValueError("Buffer contains packets of different sizes")
+
+    return {
+        "target_joints": np.degrees(packets["target_joints"]),
+        "actual_joints": np.degrees(packets["actual_joints"]),
+        "forces": packets["forces"],
+        "pose": packets["pose"],
+        "time": packets["time"],
+    }
+
+
+def _empty_columns():
+    columns = {}
+    for name, _, count in RT_FIELDS:
+        columns[name] = np.empty((0, count) if count > 1 else (0,))
+    return columns
+
+
+def _column_file(path, name):
+    return os.path.join(path, name + ".f8")
+
+
+class TelemetryRecorder(object):
+    """
+    Appends decoded samples to a directory with one fixed record file per column. Samples are
+    written in batches of flush_every, so memory stays constant for recordings of any length.
+
+    Args:
+        path: String. Directory of the recording, created if needed
+        flush_every: Integer. Number of samples buffered before they are written
+    """
+
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._pending = []
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta = {"columns": [[name, count] for name, _, count in RT_FIELDS]}
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f)
+        self._files = {}
+        for name, _, _ in RT_FIELDS:
+            self._files[name] = open(_column_file(path, name), "wb")
+
+    def append(self, sample):
+        """
+        Args:
+            sample: dictionary as returned by simple_comm.decode_packet
+        """
+        self._pending.append(sample)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def extend(self, columns):
+        """
+        Args:
+            columns: dictionary of column arrays as returned by decode_packets
+        """
+        self.flush()
+        for name, _, _ in RT_FIELDS:
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=COLUMN_DTYPE).tobytes())
+        self.count += len(columns["time"])
+
+    def record(self, source, duration=None, poll_interval=0.05):
+        """
+        Drains a TelemetryStreamer (or anything with drain()) into the recording
+
+        Args:
+            source: object with a drain() method returning samples
+            duration: float. Seconds to record, until interrupted if None
+            poll_interval: float. Seconds between two drains
+        """
+        end = None if duration is None else time.time() + duration
+        try:
+            while end is None or time.time() < end:
+                for sample in source.drain():
+                    self.append(sample)
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        for sample in source.drain():
+            self.append(sample)
+        self.flush()
+
+    def flush(self):
+        if self._pending:
+            for name, _, count in RT_FIELDS:
+                values = np.array([s[name] for s in self._pending], dtype=COLUMN_DTYPE)
+                self._files[name].write(values.reshape(len(self._pending), count).ravel().tobytes())
+            self.count += len(self._pending)
+            self._pending = []
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TelemetryLog(object):
+    """
+    Read access to a recording. Columns are memory-mapped, so opening is instant and only
+    the samples that are read are loaded from disk.
+
+    Args:
+        path: String. Directory written by TelemetryRecorder
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.columns = {}
+        self.count = None
+        for name, count in meta["columns"]:
+            filename = _column_file(path, name)
+            n = os.path.getsize(filename) // (COLUMN_DTYPE.itemsize * count)
+            self.count = n if self.count is None else min(self.count, n)
+            shape = (n, count) if count > 1 else (n,)
+            self.columns[name] = np.memmap(filename, dtype=COLUMN_DTYPE, mode="r", shape=shape) if n else np.empty(shape)
+        self.count = self.count or 0
+        self.time = self.columns["time"]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """
+        Returns:
+            sample: dictionary shaped like simple_comm.decode_packet output
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Sample %s out of range" % index)
+        sample = {}
+        for name, _, count in RT_FIELDS:
+            value = self.columns[name][index]
+            if name in ("target_joints", "actual_joints"):
+                sample[name] = value.tolist()
+            elif count > 1:
+                sample[name] = tuple(value.tolist())
+            else:
+                sample[name] = (float(value),)
+        return sample
+
+    def index_at_time(self, t):
+        """
+        Index of the last sample at or before controller time t, 0 for earlier times. Binary search,
+        so gaps from reconnects or dropped samples cost nothing extra.
+        """
+        if self.count == 0:
+            raise IndexError("Empty recording")
+        i = int(np.searchsorted(self.time[:self.count], t, "right")) - 1
+        return min(max(i, 0), self.count - 1)
+
+    def at_time(self, t):
+        return self[self.index_at_time(t)]
+
+
+class TelemetryReplayer(object):
+    """
+    Feeds a recording back through the consumer API of simple_comm.TelemetryStreamer
+    (start, stop, latest, drain), following the recorded controller time.
+
+    Args:
+        log: TelemetryLog or path of a recording
+        speed: float. Replay speed factor, 1.0 is real time, None replays as fast as possible
+        capacity: Integer. Number of samples kept in the ring buffer
+        start_index: Integer. First sample to replay
+    """
+
+    def __init__(self, log, speed=1.0, capacity=1000, start_index=0):
+        if not isinstance(log, TelemetryLog):
+            log = TelemetryLog(log)
+        self.log = log
+        self.speed = speed
+        self.start_index = start_index
+        self.buffer = c.RingBuffer(capacity)
+        self.packets = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def latest(self):
+        return self.buffer.latest()
+
+    def drain(self):
+        return self.buffer.drain()
+
+    def _run(self):
+        log = self.log
+        if self.start_index >= len(log):
+            return
+        t0 = log.time[self.start_index]
+        wall0 = time.time()
+        for i in range(self.start_index, len(log)):
+            if not self.running:
+                break
+            if self.speed:
+                delay = wall0 + (log.time[i] - t0) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.buffer.append(log[i])
+            self.packets += 1
+        self.running = False
+
@@ -4,9 +4,11 @@ This module contains utility functions:
     2) Useful geometry functions e.g. Intersections
 """
 
-import Rhino.Geometry as rg
+from geometry import rg
 import math
 
+import profiling
+
 # ----- Coordinate System conversions -----
 
 def rhino_to_robotbase(ref_plane, model_base):
@@ -28,6 +30,7 @@ def rhino_to_robotbase(ref_plane, model_base):
     ref_plane.Transform(_matrix)
     return ref_plane
 
+@profiling.profiled("utils.matrix_to_axis_angle")
 def matrix_to_axis_angle(m):
     """
     Function that transforms a 4x4 matrix to axis-angle format
@@ -121,19 +124,21 @@ def matrix_to_euler(m):
 
 # ----- Matrix related helper functions
 
-def dh_matrix((d, theta, a, alpha)):
+def dh_matrix(dh_params):
     """
     This function creates the Denavit Hartenberg transformation matrix between adjacent frames
     
     Arguments:
-        d: Joint distance. in mm
-        theta: joint angle. in radians
-        a: link length. in mm
-        alpha: twist angle. in radians
+        dh_params: tuple (d, theta, a, alpha) with
+            d: Joint distance. in mm
+            theta: joint angle. in radians
+            a: link length. in mm
+            alpha: twist angle. in radians
     
     Returns:
         m: Denavit Hartenberg transformation matrix
     """
+    d, theta, a, alpha = dh_params
     
     _matrix = [
     (math.cos(theta), -math.sin(theta) * math.cos(alpha),math.sin(theta) * math.sin(alpha),a * math.cos(theta)),